@@ -0,0 +1,142 @@
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+from pathlib import Path
+from threading import Lock
+from typing import Tuple
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from playwright.async_api import Route
+
+from motleycrew.common import logger
+
+
+# google fonts returns woff2 fonts only for modern browsers
+SEED_USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"
+)
+CSS_URL_PATTERN = re.compile(r"""url\(\s*["']?([^"')]+)["']?\s*\)""", re.IGNORECASE)
+
+
+class AssetCache:
+    """Local cache of remote fonts, css and images used by the banner html code.
+
+    During rendering http(s) requests are served from the cache directory and all other
+    remote requests are blocked, so renders do not wait on the network. The cache is
+    seeded in advance with seed/seed_url or filled on the fly when allow_network is set.
+    """
+
+    def __init__(self, cache_dir: str, allow_network: bool = False):
+        self.cache_dir = Path(cache_dir).resolve()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.allow_network = allow_network
+
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__blocked = 0
+
+    def __getstate__(self):
+        # the cache is sent to the render server with the render request
+        return {"cache_dir": self.cache_dir, "allow_network": self.allow_network}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def stats(self) -> dict:
+        return {"hits": self.__hits, "blocked": self.__blocked}
+
+    def get(self, url: str) -> Tuple[bytes, str] | None:
+        """Returns cached body and content type of the url"""
+        body_path, meta_path = self.__entry_paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                content_type = json.load(f)["content_type"]
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return body, content_type
+
+    def put(self, url: str, body: bytes, content_type: str | None = None):
+        """Saves the url body to the cache"""
+        content_type = content_type or mimetypes.guess_type(url.split("?")[0])[0] or "application/octet-stream"
+        body_path, meta_path = self.__entry_paths(url)
+
+        # unique tmp file, concurrent puts of the same url must not share it
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=body_path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, body_path)
+
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "content_type": content_type}, f)
+
+    def seed(self, url: str, path: str, content_type: str | None = None):
+        """Adds the local file to the cache as the url body"""
+        with open(path, "rb") as f:
+            self.put(url, f.read(), content_type or mimetypes.guess_type(path)[0])
+
+    def seed_url(self, url: str, timeout: float = 30) -> int:
+        """Downloads the url to the cache, fonts and images of a css file are downloaded too
+
+        Returns:
+            int: number of cached urls
+        """
+        request = Request(url, headers={"User-Agent": SEED_USER_AGENT})
+        with urlopen(request, timeout=timeout) as response:
+            body = response.read()
+            content_type = response.headers.get_content_type()
+        self.put(url, body, content_type)
+        num_cached = 1
+
+        if content_type == "text/css":
+            for reference in CSS_URL_PATTERN.findall(body.decode("utf-8", errors="ignore")):
+                if reference.startswith("data:"):
+                    continue
+                num_cached += self.seed_url(urljoin(url, reference), timeout)
+
+        return num_cached
+
+    async def handle_route(self, route: Route):
+        """Playwright route handler"""
+        url = route.request.url
+        if not url.startswith(("http://", "https://")):
+            await route.continue_()
+            return
+
+        entry = self.get(url)
+        if entry is not None:
+            body, content_type = entry
+            with self.__lock:
+                self.__hits += 1
+            # fonts are loaded with cors from the file origin
+            headers = {"content-type": content_type, "access-control-allow-origin": "*"}
+            await route.fulfill(status=200, body=body, headers=headers)
+            return
+
+        if self.allow_network:
+            try:
+                response = await route.fetch()
+                body = await response.body()
+            except Exception as e:
+                logger.warning("Failed to fetch asset {}: {}".format(url, e))
+                await route.abort()
+                return
+
+            if response.ok:
+                self.put(url, body, response.headers.get("content-type"))
+            await route.fulfill(response=response, body=body)
+            return
+
+        with self.__lock:
+            self.__blocked += 1
+        logger.info("Blocked not cached asset {}".format(url))
+        await route.abort("blockedbyclient")
+
+    def __entry_paths(self, url: str) -> Tuple[Path, Path]:
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / name, self.cache_dir / "{}.json".format(name)
@@ -0,0 +1,532 @@
+import asyncio
+import atexit
+import io
+import sys
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import async_playwright, Browser, Page, Playwright
+from PIL import Image
+
+from asset_cache import AssetCache
+from layout import LayoutReport, extract_layout
+from render_stats import RenderStats, add_timing, get_render_stats
+from motleycrew.common import logger
+
+
+DEFAULT_VIEW_SIZE = {"width": 1280, "height": 720}
+
+# the page must have a file origin to load local images of the html code rendered from memory
+CONTENT_BASE_DIR = Path(__file__).resolve().parent
+CONTENT_BASE_URL = CONTENT_BASE_DIR.as_uri() + "/"
+
+
+@dataclass
+class ScreenshotProfile:
+    """Screenshot encoding settings.
+
+    Attributes:
+        image_format (str): png, jpeg or webp
+        quality (int): jpeg and webp quality 0-100
+        full_page (bool): capture the whole page, otherwise the page is clipped to the viewport
+        scale (float): image size multiplier
+    """
+
+    image_format: str = "png"
+    quality: Optional[int] = None
+    full_page: bool = True
+    scale: float = 1.0
+
+    @property
+    def image_ext(self) -> str:
+        return "jpg" if self.image_format == "jpeg" else self.image_format
+
+    async def screenshot(
+        self, page: Page, image_path: str | None = None, timings: Dict[str, float] | None = None
+    ) -> bytes:
+        """Takes page screenshot encoded with the profile settings
+
+        Args:
+            page (Page): loaded page
+            image_path (str): path to save the image
+            timings (dict): screenshot and encode seconds are added to it
+        """
+        # chromium encodes only png and jpeg, other formats and scaling are done with pillow
+        is_converted = self.image_format not in ("png", "jpeg") or self.scale != 1
+        start = time.perf_counter()
+        if not is_converted:
+            quality = self.quality if self.image_format == "jpeg" else None
+            image = await page.screenshot(
+                path=image_path, type=self.image_format, quality=quality, full_page=self.full_page
+            )
+            add_timing(timings, "screenshot", start)
+            return image
+
+        image = await page.screenshot(type="png", full_page=self.full_page)
+        add_timing(timings, "screenshot", start)
+
+        start = time.perf_counter()
+        image = await asyncio.to_thread(self.convert, image)
+        if image_path is not None:
+            await asyncio.to_thread(Path(image_path).write_bytes, image)
+        add_timing(timings, "encode", start)
+        return image
+
+    def convert(self, image: bytes) -> bytes:
+        """Scales and encodes png image"""
+        img = Image.open(io.BytesIO(image))
+        if self.scale != 1:
+            size = (max(1, round(img.width * self.scale)), max(1, round(img.height * self.scale)))
+            img = img.resize(size, Image.LANCZOS)
+
+        if self.image_format == "jpeg" and img.mode != "RGB":
+            img = img.convert("RGB")
+
+        save_kwargs = {} if self.quality is None or self.image_format == "png" else {"quality": self.quality}
+        buffer = io.BytesIO()
+        img.save(buffer, format=self.image_format.upper(), **save_kwargs)
+        return buffer.getvalue()
+
+
+SCREENSHOT_PROFILES = {
+    "final": ScreenshotProfile(),
+    "preview": ScreenshotProfile(image_format="jpeg", quality=70, full_page=False, scale=0.5),
+    "checker": ScreenshotProfile(image_format="jpeg", quality=85, full_page=False),
+}
+
+
+def find_screenshot_profile(profile: str | ScreenshotProfile) -> ScreenshotProfile:
+    if isinstance(profile, ScreenshotProfile):
+        return profile
+    if profile not in SCREENSHOT_PROFILES:
+        raise ValueError("Screenshot profile {} not found".format(profile))
+    return SCREENSHOT_PROFILES[profile]
+
+
+@dataclass
+class RenderRequest:
+    """Html page render parameters, one screenshot is taken for every view size.
+
+    Either url of the saved html code or the html code itself must be set, relative
+    references of the html code are resolved from base_url, CONTENT_BASE_URL by default.
+    Remote requests of the page are served by the asset cache when it is set.
+    The slogan element is measured for every view size when the slogan is set.
+    """
+
+    view_sizes: List[Optional[dict]]
+    url: Optional[str] = None
+    html: Optional[str] = None
+    image_paths: Optional[List[str]] = None
+    asset_cache: Optional[AssetCache] = None
+    screenshot_profile: ScreenshotProfile = field(default_factory=ScreenshotProfile)
+    slogan: Optional[str] = None
+    base_url: Optional[str] = None
+
+
+@dataclass
+class RenderResult:
+    """Images and slogan layouts in the view sizes order of the render request, timings of the render stages"""
+
+    images: List[bytes]
+    layouts: Optional[List[LayoutReport]] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+async def render_page(page: Page, request: RenderRequest) -> RenderResult:
+    """Loads the page once and takes screenshot for every view size of the request
+
+    Returns:
+        RenderResult: images and layouts in the view sizes order
+    """
+    view_sizes = request.view_sizes
+    timings = {}
+    # pooled pages are shared between renderers, so the viewport is always reset
+    await page.set_viewport_size(view_sizes[0] or DEFAULT_VIEW_SIZE)
+
+    asset_cache = request.asset_cache
+    if asset_cache is not None:
+        await page.route("**/*", asset_cache.handle_route)
+
+    try:
+        start = time.perf_counter()
+        if request.url is not None:
+            await page.goto(request.url)
+        else:
+            # set_content keeps the page url, a pooled page may be left on any page of another renderer
+            base_url = request.base_url or CONTENT_BASE_URL
+            if page.url != base_url:
+                await page.goto(base_url)
+            await page.set_content(request.html)
+        add_timing(timings, "goto", start)
+
+        # the screenshot waits for web fonts too, the explicit wait separates font loading time
+        start = time.perf_counter()
+        await page.evaluate("() => document.fonts.ready.then(() => true)")
+        add_timing(timings, "fonts", start)
+
+        images = []
+        layouts = [] if request.slogan is not None else None
+        image_paths = request.image_paths or [None] * len(view_sizes)
+        for i, (view_size, image_path) in enumerate(zip(view_sizes, image_paths)):
+            # other sizes reuse the loaded page, the layout is only recalculated
+            if i > 0:
+                await page.set_viewport_size(view_size or DEFAULT_VIEW_SIZE)
+            if layouts is not None:
+                start = time.perf_counter()
+                layouts.append(await extract_layout(page, request.slogan))
+                add_timing(timings, "layout", start)
+            images.append(await request.screenshot_profile.screenshot(page, image_path, timings))
+    finally:
+        if asset_cache is not None:
+            await page.unroute("**/*", asset_cache.handle_route)
+
+    return RenderResult(images, layouts, timings)
+
+
+def create_render_job(request: RenderRequest) -> Callable[[Page], Awaitable[RenderResult]]:
+    """Wraps the render request to the pool job"""
+
+    async def job(page: Page) -> RenderResult:
+        return await render_page(page, request)
+
+    return job
+
+
+class BrowserPool:
+    """Long-lived Chromium browser with a bounded pool of warm pages.
+
+    The browser lives on a private event loop in a daemon thread, so one pool can be
+    shared by all renderers, generators and Streamlit sessions of the process.
+    Every page has its own browser context. Pages are reused between jobs, a page that
+    failed a job is thrown away and the browser is relaunched when it crashes.
+    """
+
+    __instances: Dict[bool, "BrowserPool"] = {}
+    __instances_lock = Lock()
+    __is_atexit_registered = False
+
+    def __init__(self, headless: bool = True, max_pages: int = 4, stats: RenderStats | None = None):
+        self.headless = headless
+        self.max_pages = max_pages
+        self.stats = stats or get_render_stats()
+
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[Thread] = None
+        self.__lock = Lock()
+        self.__is_closed = False
+
+        self.__playwright: Optional[Playwright] = None
+        self.__browser: Optional[Browser] = None
+        self.__browser_lock = asyncio.Lock()
+        self.__pages_condition = asyncio.Condition()
+        self.__idle_pages: List[Page] = []
+        self.__num_pages = 0
+
+    @classmethod
+    def get_pool(cls, headless: bool = True, max_pages: int = 4) -> "BrowserPool":
+        """Returns the pool shared by the whole process, creates it on first call
+
+        Args:
+            headless (bool): run browser in headless mode
+            max_pages (int): pages limit, used only when the pool is created
+
+        Returns:
+            BrowserPool: shared pool
+        """
+        with cls.__instances_lock:
+            pool = cls.__instances.get(headless)
+            if pool is None or pool.is_closed:
+                pool = cls(headless=headless, max_pages=max_pages)
+                cls.__instances[headless] = pool
+
+            if not cls.__is_atexit_registered:
+                atexit.register(cls.close_all)
+                cls.__is_atexit_registered = True
+        return pool
+
+    @classmethod
+    def close_all(cls):
+        with cls.__instances_lock:
+            pools = list(cls.__instances.values())
+            cls.__instances.clear()
+
+        for pool in pools:
+            pool.close()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.__is_closed
+
+    def submit(self, job: Callable[[Page], Awaitable[Any]]) -> Future:
+        """Schedules the job on a pooled page
+
+        Args:
+            job (Callable): coroutine function that receives a page
+
+        Returns:
+            Future: concurrent future with the job result
+        """
+        if self.__is_closed:
+            raise RuntimeError("Browser pool is closed")
+
+        loop = self.__start_loop()
+        return asyncio.run_coroutine_threadsafe(self.__run_job(job), loop)
+
+    def submit_many(
+        self,
+        jobs: List[Callable[[Page], Awaitable[Any]]],
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        return_exceptions: bool = False,
+    ) -> Future:
+        """Schedules the jobs on several pooled pages at once
+
+        Args:
+            jobs (list): coroutine functions that receive a page
+            concurrency (int): max number of jobs running at the same time, max_pages by default
+            timeout (float): seconds for every single job
+            return_exceptions (bool): return job exceptions as results like asyncio.gather
+
+        Returns:
+            Future: concurrent future with the list of jobs results in the jobs order
+        """
+        if self.__is_closed:
+            raise RuntimeError("Browser pool is closed")
+
+        loop = self.__start_loop()
+        coro = self.__run_jobs(jobs, concurrency or self.max_pages, timeout, return_exceptions)
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def submit_render_requests(
+        self,
+        requests: List[RenderRequest],
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        return_exceptions: bool = False,
+    ) -> Future:
+        """Schedules the render requests, see submit_many
+
+        Returns:
+            Future: concurrent future with the list of render results in the requests order
+        """
+        jobs = [create_render_job(request) for request in requests]
+        return self.submit_many(jobs, concurrency, timeout, return_exceptions)
+
+    def run(self, job: Callable[[Page], Awaitable[Any]], timeout: float | None = None) -> Any:
+        """Runs the job on a pooled page and waits for the result
+
+        Args:
+            job (Callable): coroutine function that receives a page
+            timeout (float): seconds to wait for the result
+
+        Returns:
+            job result
+        """
+        future = self.submit(job)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def warm_up(self, num_pages: int | None = None, timeout: float | None = None):
+        """Launches the browser and opens pages before the first job
+
+        Args:
+            num_pages (int): number of warm pages, max_pages by default
+        """
+        num_pages = min(num_pages or self.max_pages, self.max_pages)
+        loop = self.__start_loop()
+        asyncio.run_coroutine_threadsafe(self.__warm_up(num_pages), loop).result(timeout)
+
+    def close(self, timeout: float = 10):
+        """Closes pages, the browser and stops the pool event loop"""
+        with self.__lock:
+            if self.__is_closed:
+                return
+            self.__is_closed = True
+            loop = self.__loop
+            thread = self.__thread
+
+        if loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self.__shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.warning("Failed to close browser pool: {}".format(e))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+
+    def __start_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                loop = asyncio.ProactorEventLoop() if sys.platform == "win32" else asyncio.new_event_loop()
+                thread = Thread(target=self.__run_loop, args=(loop,), name="browser_pool", daemon=True)
+                thread.start()
+                self.__loop = loop
+                self.__thread = thread
+            return self.__loop
+
+    @staticmethod
+    def __run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def __run_job(self, job: Callable[[Page], Awaitable[Any]]) -> Any:
+        page = await self.__acquire_page()
+        is_broken = True
+        try:
+            result = await job(page)
+            is_broken = False
+            return result
+        finally:
+            await self.__release_page(page, is_broken)
+
+    async def __run_jobs(
+        self,
+        jobs: List[Callable[[Page], Awaitable[Any]]],
+        concurrency: int,
+        timeout: float | None,
+        return_exceptions: bool,
+    ) -> List[Any]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_job(job: Callable[[Page], Awaitable[Any]]) -> Any:
+            async with semaphore:
+                return await asyncio.wait_for(self.__run_job(job), timeout)
+
+        return await asyncio.gather(*[run_job(job) for job in jobs], return_exceptions=return_exceptions)
+
+    async def __acquire_page(self) -> Page:
+        async with self.__pages_condition:
+            while True:
+                while self.__idle_pages:
+                    page = self.__idle_pages.pop()
+                    if self.__is_page_alive(page):
+                        return page
+                    self.__num_pages -= 1
+                    await self.__close_page(page)
+
+                if self.__num_pages < self.max_pages:
+                    self.__num_pages += 1
+                    break
+                await self.__pages_condition.wait()
+
+        try:
+            return await self.__new_page()
+        except BaseException:
+            async with self.__pages_condition:
+                self.__num_pages -= 1
+                self.__pages_condition.notify()
+            raise
+
+    async def __release_page(self, page: Page, is_broken: bool = False):
+        is_broken = is_broken or self.__is_closed or not self.__is_page_alive(page)
+        if is_broken:
+            await self.__close_page(page)
+
+        async with self.__pages_condition:
+            if is_broken:
+                self.__num_pages -= 1
+            else:
+                self.__idle_pages.append(page)
+            self.__pages_condition.notify()
+
+    async def __new_page(self) -> Page:
+        browser = await self.__ensure_browser()
+        context = await browser.new_context()
+        return await context.new_page()
+
+    async def __ensure_browser(self) -> Browser:
+        async with self.__browser_lock:
+            if self.__browser is not None and self.__browser.is_connected():
+                return self.__browser
+
+            if self.__browser is not None:
+                logger.warning("Browser disconnected, relaunching")
+                await self.__close_browser()
+
+            start = time.perf_counter()
+            try:
+                self.__browser = await self.__launch_browser()
+            except Exception as e:
+                logger.warning("Failed to launch browser: {}, restarting playwright".format(e))
+                await self.__stop_playwright()
+                self.__browser = await self.__launch_browser()
+            self.stats.record("launch", time.perf_counter() - start)
+
+            logger.info("Launched pooled Chromium browser")
+            return self.__browser
+
+    async def __launch_browser(self) -> Browser:
+        if self.__playwright is None:
+            self.__playwright = await async_playwright().start()
+        return await self.__playwright.chromium.launch(headless=self.headless)
+
+    async def __warm_up(self, num_pages: int):
+        pages = []
+        async with self.__pages_condition:
+            num_new_pages = max(0, min(num_pages - len(self.__idle_pages), self.max_pages - self.__num_pages))
+            self.__num_pages += num_new_pages
+
+        try:
+            for _ in range(num_new_pages):
+                pages.append(await self.__new_page())
+        finally:
+            async with self.__pages_condition:
+                self.__num_pages -= num_new_pages - len(pages)
+                self.__idle_pages.extend(pages)
+                self.__pages_condition.notify_all()
+
+    def __is_page_alive(self, page: Page) -> bool:
+        if page.is_closed():
+            return False
+        browser = page.context.browser
+        return browser is self.__browser and browser is not None and browser.is_connected()
+
+    @staticmethod
+    async def __close_page(page: Page):
+        try:
+            await page.context.close()
+        except Exception:
+            pass
+
+    async def __close_browser(self):
+        browser, self.__browser = self.__browser, None
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception:
+            pass
+
+    async def __stop_playwright(self):
+        playwright, self.__playwright = self.__playwright, None
+        if playwright is None:
+            return
+        try:
+            await playwright.stop()
+        except Exception:
+            pass
+
+    async def __shutdown(self):
+        async with self.__pages_condition:
+            pages, self.__idle_pages = self.__idle_pages, []
+            self.__num_pages -= len(pages)
+            self.__pages_condition.notify_all()
+
+        for page in pages:
+            await self.__close_page(page)
+
+        async with self.__browser_lock:
+            await self.__close_browser()
+            await self.__stop_playwright()
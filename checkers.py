@@ -1,36 +1,101 @@
 from abc import ABC, abstractmethod
-from queue import Queue
+from dataclasses import asdict, is_dataclass
+import json
+import os
+import re
+import string
+import tempfile
+from queue import Empty, Queue
 from threading import Thread
 import time
 
-from utils import show_image
+import cv2
+import editdistance
+import numpy as np
+
+from exceptions import (
+    REVIEW_TIMEOUT_APPROVE,
+    REVIEW_TIMEOUT_BEST,
+    REVIEW_TIMEOUT_POLICIES,
+    ReviewTimeoutException,
+)
+from layout import LayoutReport
+from render_cache import find_local_assets
+from utils import show_image, read_image, contrast_ratio, resize_cover, find_clutter_points, boxes_mask
+from verdict_cache import Verdict, VerdictCache
+from motleycrew.common import logger
 from motleycrew.common.exceptions import InvalidOutput
 from tools.image_description_tool import GptImageProcessor
 from viewers import StreamLitItemView, StreamLitItemQueueViewer, StreamLitItemFormView
 
 
 REMARKS_WIDGET_KEY = "remarks"
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+# alphabet of KerasOcrTextDetector, tensorflow is not imported to read it
+KERAS_OCR_ALPHABET = string.digits + string.ascii_lowercase
+
+
+def find_background_image(html: str | None, base_dir: str | None = None) -> str | None:
+    """Returns the largest local image referenced by the html code"""
+    if not html:
+        return None
+    images = [path for path in find_local_assets(html, base_dir) if path.suffix.lower() in IMAGE_SUFFIXES]
+    if not images:
+        return None
+    return str(max(images, key=lambda path: path.stat().st_size))
 
 
 class BaseChecker(ABC):
 
+    is_human = False
+    # the verdict depends on the image only, so it can be reused for an unchanged render
+    reuses_verdict = True
+    # quality of the last checked image from 0 to 1, pass/fail is used if the checker does not set it
+    last_score = None
+
     @abstractmethod
-    def check(self, image_path: str) -> bool:
+    def check(self, image: str | bytes) -> bool:
+        """Checks the rendered image
+
+        Args:
+            image (str | bytes): image path or encoded image bytes
+
+        Returns:
+            bool: True if the image is accepted, otherwise raises InvalidOutput
+        """
+        pass
+
+    def fingerprint(self) -> str:
+        """Returns json of the checker settings changing its verdict, public plain attributes by default"""
+        data = {}
+        for name, value in vars(self).items():
+            if name.startswith("_") or name == "last_score":
+                continue
+            if is_dataclass(value):
+                value = asdict(value)
+            if isinstance(value, (str, int, float, bool, type(None), dict, list, tuple)):
+                data[name] = value
+        return json.dumps(data, sort_keys=True, default=str)
+
+    def release(self):
+        """Releases loaded models and other resources held between checks"""
         pass
 
 
 class CliHumanChecker(BaseChecker):
 
+    is_human = True
+
     remarks_prefix = {"recommendation": "ask recommendations how"}
     remarks_postfix = {
         "recommendation": "Need text coordinates (x, y, width, height), color, size, slant text block,"
         " font, add the slogan text to the recommendation request",
     }
 
-    def check(self, image_path: str) -> bool:
+    def check(self, image: str | bytes) -> bool:
         # show image
         q = Queue()
-        t = Thread(target=show_image, args=[image_path, q])
+        t = Thread(target=show_image, args=[image, q])
         t.start()
 
         # remarks
@@ -55,47 +120,64 @@ class CliHumanChecker(BaseChecker):
 
 class GptImageChecker(BaseChecker):
 
+    result_ok_symbols = "THERE ARE NO COMMENTS"
+
     def __init__(self, text: str = ""):
         self.checked_text = f"'{text}'" or ""
-
-    def check(self, image_path: str) -> bool:
-        result_ok_symbols = "THERE ARE NO COMMENTS"
-        prompt = """Look at the image, evaluate the quality of the text display {}, 
+        self.prompt = """Look at the image, evaluate the quality of the text display {}, 
         and if there are comments recommendations for better display such as (color, size, location, decoration) 
         of the text have come. If the text is displayed well, 
         then they only came {}.""".format(
-            self.checked_text, result_ok_symbols
+            self.checked_text, self.result_ok_symbols
         )
+        self.__image_processor = None
 
-        image_processor = GptImageProcessor(prompt=prompt)
-        image_result = image_processor.process_image(image_path)
+    def check(self, image: str | bytes) -> bool:
+        if self.__image_processor is None:
+            self.__image_processor = GptImageProcessor(prompt=self.prompt)
+        image_result = self.__image_processor.process_image(image)
 
-        if result_ok_symbols.lower() not in image_result.lower():
+        if self.result_ok_symbols.lower() not in image_result.lower():
             raise InvalidOutput(image_result)
         return True
 
 
 class StreamLitHumanChecker(BaseChecker):
+    """Waits for the user remarks from the Streamlit form.
+
+    An abandoned browser tab must not pin the generator, so the wait can be limited by
+    review_timeout seconds, by default it is not limited. Then the image is approved, the generation
+    is aborted or the best render is returned by the output handler, depending on timeout_policy.
+    """
+
+    is_human = True
 
     def __init__(
         self,
         iteration: int = 0,
         viewer: StreamLitItemQueueViewer = None,
         remarks_queue: Queue = None,
+        review_timeout: float | None = None,
+        timeout_policy: str = REVIEW_TIMEOUT_APPROVE,
     ):
+        if timeout_policy not in REVIEW_TIMEOUT_POLICIES:
+            raise ValueError("Unknown review timeout policy {}".format(timeout_policy))
         self.iteration = iteration
         self.viewer = viewer
         self.remarks_queue = remarks_queue
+        self.review_timeout = review_timeout
+        self.timeout_policy = timeout_policy
 
-    def check(self, image_path: str) -> bool:
+    def check(self, image: str | bytes) -> bool:
         self.iteration += 1
         if not isinstance(self.viewer, StreamLitItemQueueViewer):
             raise ValueError("Viewer must be init  StreamLitItemQueueViewer")
 
+        image_text = "Image path: {}".format(image) if isinstance(image, str) else "Image rendered in memory"
         start_check_view_data = {
             "subheader": ("Human check: {}".format(self.iteration),),
-            "text": ("Image path: {}".format(image_path),),
-            "image": (image_path, "Checked image"),
+            "text": (image_text,),
+            "image": (image, "Checked image"),
         }
         self.viewer.view(StreamLitItemView(start_check_view_data), to_history=True)
 
@@ -115,7 +197,10 @@ class StreamLitHumanChecker(BaseChecker):
         if self.remarks_queue is None:
             return True
 
-        remarks = self.remarks_queue.get()
+        try:
+            remarks = self.remarks_queue.get(timeout=self.review_timeout)
+        except Empty:
+            self.on_review_timeout()
         if remarks:
             remarks_title = "Remarks for html generation:"
             remarks_view_data = {"text": (remarks_title,), "markdown": (remarks,)}
@@ -125,3 +210,638 @@ class StreamLitHumanChecker(BaseChecker):
             raise InvalidOutput("{}: {}".format(remarks_title, remarks))
 
         return True
+
+    def on_review_timeout(self):
+        """Raises ReviewTimeoutException, the output handler releases the checkers and applies the policy"""
+        msg = "Human check {} is not received in {} seconds".format(self.iteration, self.review_timeout)
+        logger.warning("{}, timeout policy: {}".format(msg, self.timeout_policy))
+        if self.timeout_policy == REVIEW_TIMEOUT_APPROVE:
+            self.viewer.view(StreamLitItemView({"text": ("{}, the image is approved".format(msg),)}))
+        elif self.timeout_policy == REVIEW_TIMEOUT_BEST:
+            self.viewer.view(StreamLitItemView({"text": ("{}, the best image is selected".format(msg),)}))
+        raise ReviewTimeoutException(msg, self.timeout_policy)
+
+
+class LayoutChecker(BaseChecker):
+    """Checks the slogan geometry measured by the renderer, no image processing is needed.
+
+    The layout attribute is set by the HtmlRenderOutputHandler before every check.
+    """
+
+    # the verdict depends on the measured layout, not on the image
+    reuses_verdict = False
+
+    def __init__(self, min_font_size: float = 16, max_lines: int | None = None):
+        self.min_font_size = min_font_size
+        self.max_lines = max_lines
+        self.layout: LayoutReport | None = None
+
+    def check(self, image: str | bytes) -> bool:
+        layout = self.layout
+        self.last_score = None
+        if layout is None:
+            return True
+
+        remarks = []
+        if not layout.slogan_found:
+            remarks.append("the slogan text is not found on the page")
+        else:
+            if layout.is_overflowing:
+                remarks.append("the slogan text overflows its <{}> element".format(layout.tag))
+            if layout.is_clipped:
+                remarks.append(
+                    "the slogan text is out of the {}x{} banner".format(layout.viewport_width, layout.viewport_height)
+                )
+            if layout.font_size is not None and layout.font_size < self.min_font_size:
+                remarks.append(
+                    "the slogan font size {}px is less than {}px".format(layout.font_size, self.min_font_size)
+                )
+            if self.max_lines and layout.num_lines > self.max_lines:
+                remarks.append(
+                    "the slogan takes {} lines, at most {} are allowed".format(layout.num_lines, self.max_lines)
+                )
+        if layout.is_scrolling:
+            remarks.append(
+                "the page size {}x{} is larger than the banner size {}x{}, the page scrolls".format(
+                    layout.page_width, layout.page_height, layout.viewport_width, layout.viewport_height
+                )
+            )
+
+        # every problem halves the score
+        self.last_score = 0.5 ** len(remarks)
+        if remarks:
+            raise InvalidOutput("Layout remarks: {}".format("; ".join(remarks)))
+        return True
+
+
+class ContrastChecker(BaseChecker):
+    """Checks legibility of the slogan without API calls.
+
+    The slogan pixels are found by diffing the rendered banner against the background image
+    of the html code. The text is checked for WCAG contrast with its local background,
+    the share of the banner it takes and clipping at the banner edges.
+    The html attribute is set by the HtmlRenderOutputHandler before every check.
+    """
+
+    # the background image is found in the html code
+    reuses_verdict = False
+
+    def __init__(
+        self,
+        background_path: str | None = None,
+        min_contrast: float = 3.0,
+        min_text_area: float = 0.01,
+        max_text_area: float = 0.5,
+        diff_threshold: int = 40,
+        edge_margin: int = 2,
+        base_dir: str | None = None,
+    ):
+        self.background_path = background_path
+        self.min_contrast = min_contrast
+        self.min_text_area = min_text_area
+        self.max_text_area = max_text_area
+        self.diff_threshold = diff_threshold
+        self.edge_margin = edge_margin
+        self.base_dir = base_dir
+        self.html: str | None = None
+
+    def check(self, image: str | bytes) -> bool:
+        self.last_score = None
+        background_path = self.background_path or self.find_background_path()
+        if background_path is None:
+            return True
+
+        render = read_image(image)[:, :, :3]
+        h, w = render.shape[:2]
+        background = resize_cover(read_image(background_path)[:, :, :3], (w, h))
+
+        diff = cv2.absdiff(render, background).max(axis=2)
+        text_mask = np.uint8(diff > self.diff_threshold) * 255
+        text_mask = cv2.morphologyEx(text_mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        changed_area = np.count_nonzero(text_mask) / text_mask.size
+        # the background is not drawn as is, the text can not be separated from it
+        if changed_area > 0.9:
+            return True
+        if changed_area == 0:
+            self.last_score = 0.0
+            raise InvalidOutput("The slogan is not visible on the banner")
+
+        text_color, local_background_color, glyphs_mask = self.split_text_colors(render, text_mask)
+        text_area = np.count_nonzero(glyphs_mask) / glyphs_mask.size
+
+        remarks = []
+        if text_area < self.min_text_area:
+            remarks.append(
+                "the slogan text takes {:.1%} of the banner, at least {:.1%} is needed, "
+                "make the text larger".format(text_area, self.min_text_area)
+            )
+        elif text_area > self.max_text_area:
+            remarks.append(
+                "the slogan text takes {:.1%} of the banner, at most {:.1%} is allowed".format(
+                    text_area, self.max_text_area
+                )
+            )
+
+        contrast = contrast_ratio(text_color, local_background_color)
+        if contrast < self.min_contrast:
+            remarks.append(
+                "contrast of the text color rgb{} with its background rgb{} is {:.2f}:1, "
+                "at least {:.1f}:1 is needed".format(
+                    text_color, local_background_color, contrast, self.min_contrast
+                )
+            )
+
+        clipped_edges = self.find_clipped_edges(glyphs_mask)
+        if clipped_edges:
+            remarks.append("the text touches the {} edge of the banner".format(", ".join(clipped_edges)))
+
+        area_score = min(1.0, text_area / self.min_text_area, self.max_text_area / max(text_area, 1e-6))
+        contrast_score = min(1.0, contrast / self.min_contrast)
+        self.last_score = area_score * contrast_score * (0.5 if clipped_edges else 1.0)
+        if remarks:
+            raise InvalidOutput("Legibility remarks: {}".format("; ".join(remarks)))
+        return True
+
+    def find_background_path(self) -> str | None:
+        """Returns the largest local image referenced by the html code"""
+        return find_background_image(self.html, self.base_dir)
+
+    @staticmethod
+    def split_text_colors(render: np.ndarray, text_mask: np.ndarray) -> tuple:
+        """Splits the changed area into glyphs and their local background
+
+        Returns:
+            tuple: RGB text color, RGB local background color and the glyphs mask
+        """
+        h, w = text_mask.shape
+        mask = text_mask > 0
+        kernel_size = max(5, min(h, w) // 40)
+        kernel = np.ones((kernel_size, kernel_size), np.uint8)
+
+        def to_rgb(pixels: np.ndarray) -> tuple:
+            return tuple(int(v) for v in np.median(pixels, axis=0)[::-1])
+
+        # text strokes disappear after the erosion, a text box or a plate behind the text stays
+        is_text_box = np.count_nonzero(cv2.erode(text_mask, kernel)) > 0.5 * np.count_nonzero(mask)
+        if is_text_box:
+            pixels = render[mask]
+            luminance = cv2.cvtColor(pixels.reshape(-1, 1, 3), cv2.COLOR_BGR2GRAY).reshape(-1, 1)
+            threshold, _ = cv2.threshold(luminance, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            is_light = luminance.reshape(-1) > threshold
+            # glyphs are the smaller class of the box pixels
+            is_glyph = is_light if np.count_nonzero(is_light) < np.count_nonzero(~is_light) else ~is_light
+            if np.any(is_glyph):
+                glyphs_mask = np.zeros(mask.shape, dtype=bool)
+                glyphs_mask[mask] = is_glyph
+                return to_rgb(pixels[is_glyph]), to_rgb(pixels[~is_glyph]), glyphs_mask
+            return to_rgb(pixels), to_rgb(pixels), mask
+
+        ring = (cv2.dilate(text_mask, kernel) > 0) & ~mask
+        background_pixels = render[ring] if np.any(ring) else render[~mask]
+        return to_rgb(render[mask]), to_rgb(background_pixels), mask
+
+    def find_clipped_edges(self, glyphs_mask: np.ndarray) -> list:
+        m = self.edge_margin
+        edges = {
+            "top": glyphs_mask[:m, :],
+            "bottom": glyphs_mask[-m:, :],
+            "left": glyphs_mask[:, :m],
+            "right": glyphs_mask[:, -m:],
+        }
+        return [name for name, edge in edges.items() if np.any(edge)]
+
+
+class ClutterChecker(BaseChecker):
+    """Checks that the slogan is placed over a calm area of the background image.
+
+    Harris corners and Canny edges are counted on the background under the text boxes,
+    pixels covered by the page, e.g. by a plate behind the text, do not count.
+    Text boxes are measured by the renderer, without the layout they are found by diffing
+    the render against the background. The html and layout attributes are set by
+    the HtmlRenderOutputHandler before every check.
+    """
+
+    # text boxes come from the layout, the background image from the html code
+    reuses_verdict = False
+
+    def __init__(
+        self,
+        background_path: str | None = None,
+        max_edge_density: float = 0.05,
+        max_corner_density: float = 0.01,
+        diff_threshold: int = 40,
+        min_visible_share: float = 0.25,
+        base_dir: str | None = None,
+    ):
+        self.background_path = background_path
+        self.max_edge_density = max_edge_density
+        self.max_corner_density = max_corner_density
+        self.min_visible_share = min_visible_share
+        self.diff_threshold = diff_threshold
+        self.base_dir = base_dir
+        self.html: str | None = None
+        self.layout: LayoutReport | None = None
+
+    def check(self, image: str | bytes) -> bool:
+        self.last_score = None
+        background_path = self.background_path or find_background_image(self.html, self.base_dir)
+        if background_path is None:
+            return True
+
+        render = read_image(image)[:, :, :3]
+        h, w = render.shape[:2]
+        background = resize_cover(read_image(background_path)[:, :, :3], (w, h))
+        changed_mask = cv2.absdiff(render, background).max(axis=2) > self.diff_threshold
+
+        text_boxes = self.find_text_boxes(changed_mask)
+        text_mask = boxes_mask(text_boxes, (w, h))
+        text_area = np.count_nonzero(text_mask)
+        if text_area == 0:
+            return True
+
+        visible_mask = text_mask & ~changed_mask
+        visible_area = np.count_nonzero(visible_mask)
+        # the text boxes are covered by the page, the background under them is not seen
+        if visible_area < self.min_visible_share * text_area:
+            self.last_score = 1.0
+            return True
+
+        corners, edges = find_clutter_points(background)
+        edge_density = np.count_nonzero(edges & visible_mask) / visible_area
+        corner_density = np.count_nonzero(corners & visible_mask) / visible_area
+
+        self.last_score = 1.0
+        if edge_density > self.max_edge_density or corner_density > self.max_corner_density:
+            # a busy placement is decisive, the cascade rejects it before the vision model
+            self.last_score = 0.0
+            raise InvalidOutput(
+                "Clutter remarks: the slogan is placed over a busy area of the image, edges take {:.1%} "
+                "(at most {:.1%}) and corners {:.1%} (at most {:.1%}) of the background under the text, move the text to a calm "
+                "area of the image or put a plate behind it".format(
+                    edge_density, self.max_edge_density, corner_density, self.max_corner_density
+                )
+            )
+        return True
+
+    def find_text_boxes(self, changed_mask: np.ndarray) -> list:
+        """Returns (x, y, width, height) boxes of the slogan in the render pixels"""
+        h, w = changed_mask.shape
+        if self.layout is not None and self.layout.slogan_found and self.layout.text_boxes:
+            capture_width, capture_height = self.find_capture_size(w, h)
+            scale_x = w / capture_width
+            scale_y = h / capture_height
+            return [(x * scale_x, y * scale_y, bw * scale_x, bh * scale_y) for x, y, bw, bh in self.layout.text_boxes]
+
+        # glyphs of a line are merged into one box
+        kernel_size = max(3, min(h, w) // 50)
+        mask = cv2.dilate(np.uint8(changed_mask) * 255, np.ones((kernel_size, kernel_size), np.uint8))
+        num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        min_area = 0.001 * h * w
+        return [tuple(stats[label, :4]) for label in range(1, num_labels) if stats[label, 4] >= min_area]
+
+    def find_capture_size(self, width: int, height: int) -> tuple:
+        """Returns css size of the page area in the render, the viewport or the whole scrolling page
+
+        Full page screenshots capture the scrolling page, the area with the closest aspect ratio is taken.
+        """
+        layout = self.layout
+        viewport_size = (layout.viewport_width, layout.viewport_height)
+        page_size = (max(layout.viewport_width, layout.page_width), max(layout.viewport_height, layout.page_height))
+        return min((viewport_size, page_size), key=lambda size: abs(size[0] / size[1] - width / height))
+
+
+class CachedChecker(BaseChecker):
+    """Wraps any checker with the disk verdict cache.
+
+    The cache key is the image content hash, the checker type and the checker fingerprint:
+    the prompt and other settings, including the html and layout it received.
+    Human checkers are never cached.
+    """
+
+    def __init__(self, checker: BaseChecker, verdict_cache: VerdictCache):
+        self.__dict__["checker"] = checker
+        self.__dict__["verdict_cache"] = verdict_cache
+
+    @property
+    def is_human(self) -> bool:
+        return self.checker.is_human
+
+    @property
+    def reuses_verdict(self) -> bool:
+        return self.checker.reuses_verdict
+
+    @property
+    def last_score(self) -> float | None:
+        return self.checker.last_score
+
+    def __getattr__(self, name: str):
+        # viewer, layout and other attributes set by the output handler belong to the wrapped checker
+        return getattr(self.__dict__["checker"], name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.checker, name, value)
+
+    def release(self):
+        self.checker.release()
+
+    def fingerprint(self) -> str:
+        return self.checker.fingerprint()
+
+    def check(self, image: str | bytes) -> bool:
+        if self.checker.is_human:
+            return self.checker.check(image)
+
+        checker_name = "{}.{}".format(self.checker.__class__.__module__, self.checker.__class__.__qualname__)
+        key = self.verdict_cache.build_key(image, checker_name, self.checker.fingerprint())
+        verdict = self.verdict_cache.get(key)
+        if verdict is not None:
+            self.checker.last_score = verdict.score
+            if not verdict.accepted:
+                raise InvalidOutput(verdict.remarks)
+            return True
+
+        try:
+            self.checker.check(image)
+        except InvalidOutput as e:
+            verdict = Verdict(accepted=False, remarks=str(e), checker=checker_name, score=self.checker.last_score)
+            self.verdict_cache.put(key, verdict)
+            raise
+        self.verdict_cache.put(key, Verdict(accepted=True, checker=checker_name, score=self.checker.last_score))
+        return True
+
+
+class OcrSloganChecker(BaseChecker):
+    """Checks with local OCR that the slogan is fully visible and is one text block.
+
+    The slogan is compared with the best matching sequence of recognized words by the
+    normalized edit distance. The slogan attribute is set by the HtmlRenderOutputHandler.
+    """
+
+    def __init__(
+        self,
+        slogan: str | None = None,
+        text_detector=None,
+        max_distance: float = 0.25,
+        max_line_gap: float = 1.5,
+        edge_margin: int = 2,
+    ):
+        """
+        Args:
+            slogan (str): slogan text, the output handler slogan by default
+            text_detector (TextDetector): OCR detector, KerasOcrTextDetector by default, it reads only latin
+                letters, slogans with other letters are not checked, use TesseractTextDetector(path, lang="rus")
+            max_distance (float): max edit distance divided by the slogan length
+            max_line_gap (float): max gap between slogan lines in median word heights
+            edge_margin (int): words closer to the image edge are considered cut off
+        """
+        self.slogan = slogan
+        self.max_distance = max_distance
+        self.max_line_gap = max_line_gap
+        self.edge_margin = edge_margin
+        self.__text_detector = text_detector
+        self.__is_own_text_detector = False
+
+    @staticmethod
+    def normalize_word(text: str) -> str:
+        # keras ocr recognizes only lowercase letters and digits
+        return re.sub(r"[\W_]+", "", text.lower())
+
+    @property
+    def alphabet(self) -> str | None:
+        """Characters the text detector recognizes, None if any"""
+        if self.__text_detector is None:
+            # the default detector is not loaded only to read its alphabet
+            return KERAS_OCR_ALPHABET
+        return getattr(self.__text_detector, "alphabet", None)
+
+    def check(self, image: str | bytes) -> bool:
+        self.last_score = None
+        if not self.slogan:
+            return True
+        slogan_text = self.normalize_word(self.slogan)
+        if not slogan_text:
+            return True
+        alphabet = self.alphabet
+        if alphabet is not None and any(c not in alphabet for c in slogan_text):
+            # e.g. cyrillic slogans for the latin keras ocr, no verdict instead of a false rejection
+            logger.info("OCR detector can not read the slogan \"{}\", the check is skipped".format(self.slogan))
+            return True
+
+        boxes = [box for box in self.detect_text(image) if self.normalize_word(box.text or "")]
+        if not boxes:
+            self.last_score = 0.0
+            raise InvalidOutput('The slogan "{}" is not readable on the banner'.format(self.slogan))
+
+        image_size = read_image(image).shape[1::-1]
+        words = self.sort_reading_order(boxes)
+        window, distance = self.find_slogan_words(words, slogan_text)
+        recognized = " ".join(box.text for box in window)
+        self.last_score = max(0.0, 1.0 - distance)
+        if distance > self.max_distance:
+            if slogan_text.startswith(self.normalize_word(recognized)) or self.is_cut_off(window, image_size):
+                raise InvalidOutput(
+                    'The slogan "{}" is cut off, only "{}" is visible on the banner'.format(self.slogan, recognized)
+                )
+            raise InvalidOutput(
+                'The slogan "{}" is not fully visible, the banner text is read as "{}" '
+                "(edit distance {:.0%} of the slogan length)".format(self.slogan, recognized, distance)
+            )
+
+        remarks = []
+        if self.is_cut_off(window, image_size):
+            remarks.append("the slogan text touches the banner edge and may be cut off")
+        if not self.is_single_block(window):
+            remarks.append("the slogan words are split into separate text blocks, keep the slogan in one block")
+        self.last_score *= 0.5 ** len(remarks)
+        if remarks:
+            raise InvalidOutput("OCR remarks: {}".format("; ".join(remarks)))
+        return True
+
+    def detect_text(self, image: str | bytes) -> list:
+        if self.__text_detector is None:
+            # tensorflow is imported only when the checker is used
+            from clear_image.text_detector import KerasOcrTextDetector
+
+            self.__text_detector = KerasOcrTextDetector()
+            self.__is_own_text_detector = True
+
+        if isinstance(image, str):
+            return list(self.__text_detector.detect_text(image))
+
+        # detectors read images from files
+        fd, image_path = tempfile.mkstemp(suffix=".png")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image)
+            return list(self.__text_detector.detect_text(image_path))
+        finally:
+            os.remove(image_path)
+
+    def release(self):
+        # the OCR models are loaded again on the next check
+        if self.__is_own_text_detector:
+            from clear_image.text_detector import KerasOcrTextDetector
+
+            KerasOcrTextDetector.release_instance()
+            self.__text_detector = None
+            self.__is_own_text_detector = False
+
+    @staticmethod
+    def sort_reading_order(boxes: list) -> list:
+        """Sorts words by lines from top to bottom and from left to right in a line"""
+        median_h = float(np.median([box.h for box in boxes]))
+        lines = []
+        for box in sorted(boxes, key=lambda b: b.y + b.h / 2):
+            center = box.y + box.h / 2
+            if lines and abs(center - lines[-1][0]) <= median_h / 2:
+                lines[-1][1].append(box)
+            else:
+                lines.append([center, [box]])
+        return [box for _, line in lines for box in sorted(line, key=lambda b: b.x)]
+
+    def find_slogan_words(self, words: list, slogan_text: str) -> tuple:
+        """Finds the sequence of words closest to the slogan
+
+        Returns:
+            tuple: words and the edit distance divided by the slogan length
+        """
+        best_window, best_distance = words[:1], float("inf")
+        for start in range(len(words)):
+            text = ""
+            for end in range(start, len(words)):
+                text += self.normalize_word(words[end].text)
+                distance = editdistance.eval(text, slogan_text) / len(slogan_text)
+                if distance < best_distance:
+                    best_window, best_distance = words[start: end + 1], distance
+                if len(text) > 2 * len(slogan_text):
+                    break
+        return best_window, best_distance
+
+    def is_cut_off(self, words: list, image_size: tuple) -> bool:
+        w, h = image_size
+        m = self.edge_margin
+        for box in words:
+            if box.x <= m or box.y <= m or box.x + box.w >= w - m or box.y + box.h >= h - m:
+                return True
+        return False
+
+    def is_single_block(self, words: list) -> bool:
+        if len(words) < 2:
+            return True
+        median_h = float(np.median([box.h for box in words]))
+        for box, next_box in zip(words, words[1:]):
+            vertical_gap = next_box.y - (box.y + box.h)
+            if vertical_gap > self.max_line_gap * median_h:
+                return False
+            # words of one line are close to each other
+            is_same_line = abs((next_box.y + next_box.h / 2) - (box.y + box.h / 2)) <= median_h / 2
+            if is_same_line and next_box.x - (box.x + box.w) > 3 * median_h:
+                return False
+        return True
+
+
+class CascadeChecker(BaseChecker):
+    """Runs tiers of checkers from cheap to expensive.
+
+    A tier rejects the image when the score of any its checker is below reject_below and accepts
+    it when the mean score is at least accept_above and the tier has no remarks. Ambiguous images
+    are escalated to the next tier with the remarks, the last tier (the vision model) decides,
+    but it cannot accept the image with remarks of the previous tiers.
+    Html code, layout and slogan set by the output handler are passed to the tiers checkers.
+    """
+
+    # tiers checkers receive the html code and the layout
+    reuses_verdict = False
+
+    INJECTED_ATTRIBUTES = ("html", "layout", "slogan")
+
+    def __init__(self, tiers: list, reject_below: float = 0.4, accept_above: float = 0.8):
+        """
+        Args:
+            tiers (list): lists of checkers, cheap local checkers first
+            reject_below (float): tier score below which the image is rejected
+            accept_above (float): tier score from which the image without remarks is accepted
+        """
+        if not tiers:
+            raise ValueError("At least one tier of checkers is required")
+        # set before the tiers, so the empty defaults do not overwrite slogans of the tiers checkers
+        self.html: str | None = None
+        self.layout: LayoutReport | None = None
+        self.slogan: str | None = None
+        self.tiers = [list(tier) for tier in tiers]
+        self.reject_below = reject_below
+        self.accept_above = accept_above
+        self.last_tier: int | None = None
+        self.tiers_decisions = [0] * len(self.tiers)
+
+    @classmethod
+    def create_default(cls, slogan: str, **kwargs) -> "CascadeChecker":
+        """Layout, contrast, clutter and OCR checkers first, then GptImageChecker"""
+        local_tier = [LayoutChecker(), ContrastChecker(), ClutterChecker(), OcrSloganChecker(slogan)]
+        return cls([local_tier, [GptImageChecker(slogan)]], **kwargs)
+
+    def __setattr__(self, name: str, value):
+        super().__setattr__(name, value)
+        # None is forwarded too, a stale layout must not stay in the tiers checkers
+        if name in self.INJECTED_ATTRIBUTES and "tiers" in self.__dict__:
+            for tier in self.tiers:
+                for checker in tier:
+                    if hasattr(checker, name):
+                        setattr(checker, name, value)
+
+    def check(self, image: str | bytes) -> bool:
+        self.last_score = None
+        escalated_remarks = []
+        for tier_index, tier in enumerate(self.tiers):
+            remarks, scores = [], []
+            for checker in tier:
+                checker.last_score = None
+                try:
+                    checker.check(image)
+                    score = checker.last_score if checker.last_score is not None else 1.0
+                except InvalidOutput as e:
+                    remarks.append(str(e))
+                    score = checker.last_score if checker.last_score is not None else 0.0
+                scores.append(score)
+
+            score = sum(scores) / len(scores) if scores else None
+            is_last_tier = tier_index == len(self.tiers) - 1
+            # one clearly failed checker is not averaged away by the passed ones
+            if scores and min(scores) < self.reject_below:
+                is_accepted = False
+                score = min(scores)
+            elif is_last_tier:
+                is_accepted = not remarks and not escalated_remarks
+            elif score is not None and score >= self.accept_above and not remarks:
+                is_accepted = True
+            else:
+                logger.info("Cascade tier {} score {} is ambiguous, escalate".format(tier_index, score))
+                escalated_remarks.extend(remarks)
+                continue
+
+            self.last_tier = tier_index
+            self.tiers_decisions[tier_index] += 1
+            self.last_score = score
+            logger.info(
+                "Cascade tier {} {} the image with score {}".format(
+                    tier_index, "accepted" if is_accepted else "rejected", score
+                )
+            )
+            if not is_accepted:
+                raise InvalidOutput("\n\n".join(escalated_remarks + remarks) or "The image is rejected")
+            return True
+
+    def release(self):
+        for tier in self.tiers:
+            for checker in tier:
+                checker.release()
+
+    def fingerprint(self) -> str:
+        data = {
+            "reject_below": self.reject_below,
+            "accept_above": self.accept_above,
+            "tiers": [
+                [[checker.__class__.__name__, checker.fingerprint()] for checker in tier] for tier in self.tiers
+            ],
+        }
+        return json.dumps(data, sort_keys=True)
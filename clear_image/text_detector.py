@@ -1,6 +1,7 @@
 """Interfaces for text detection."""
 import cv2
 import numpy as np
+import string
 from dataclasses import dataclass
 from typing import Sequence
 from PIL import Image
@@ -10,6 +11,9 @@ from keras_ocr.pipeline import Pipeline
 from keras_ocr.tools import drawAnnotations
 
 
+KERAS_OCR_ALPHABET = string.digits + string.ascii_lowercase
+
+
 @dataclass
 class TextBox:
   x: int
@@ -20,6 +24,9 @@ class TextBox:
 
 
 class TextDetector:
+  # recognized characters, None if the detector is not limited to a known alphabet
+  alphabet = None
+
   def detect_text(self, image_filename: str) -> Sequence[TextBox]:
     pass
 
@@ -27,17 +34,19 @@ class TextDetector:
 class TesseractTextDetector(TextDetector):
   """Uses the `tesseract` OCR library from Google to do text detection."""
 
-  def __init__(self, tesseract_path: str):
+  def __init__(self, tesseract_path: str, lang: str = "eng"):
     """
     Args:
       tesseract_path: The path where the `tesseract` library is installed, e.g. "/usr/bin/tesseract".
+      lang: Tesseract languages, e.g. "rus+eng" for Cyrillic slogans.
     """
     pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    self.lang = lang
 
   def detect_text(self, image_filename: str) -> Sequence[TextBox]:
     image = Image.open(image_filename)
-    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-    boxes = [TextBox(l, top, w, h, text)
+    data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+    boxes = [TextBox(l, top, h, w, text)
              for l, top, w, h, text in zip(data["left"], data["top"], data["width"], data["height"], data["text"])
              if text.strip()]
     return boxes
@@ -45,6 +54,9 @@ class TesseractTextDetector(TextDetector):
 
 class KerasOcrTextDetector(TextDetector):
 
+    # the default recognizer model reads only lowercase latin letters and digits
+    alphabet = KERAS_OCR_ALPHABET
+
     __instance = None
 
     def __new__(cls, *args, **kwargs):
@@ -55,6 +67,11 @@ class KerasOcrTextDetector(TextDetector):
     def __init__(self):
         self.pipeline = Pipeline()
 
+    @classmethod
+    def release_instance(cls):
+        """Drops the shared detector, its models are freed once no checker holds it"""
+        cls.__instance = None
+
     def detect_text(self, image_filename: str) -> Sequence[TextBox]:
         prediction_groups = self.pipeline.recognize([image_filename])
 
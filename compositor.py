@@ -0,0 +1,378 @@
+import io
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from fontTools.ttLib import TTFont, TTLibError
+from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont, ImageStat
+
+from render_stats import RenderStats, get_render_stats
+from utils import contrast_ratio
+
+from motleycrew.common import logger
+
+
+FONT_DIRS = (
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "~/.fonts",
+    "~/.local/share/fonts",
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    "~/Library/Fonts",
+    "C:/Windows/Fonts",
+)
+FONT_SUFFIXES = (".ttf", ".otf", ".ttc")
+# fonts with latin and cyrillic glyphs, the first installed one covering the slogan is used
+FALLBACK_FONTS = ("Arial", "DejaVu Sans", "Noto Sans", "Roboto", "Liberation Sans", "FreeSans", "Verdana", "Segoe UI")
+
+
+def normalize_font_name(name: str) -> str:
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+@lru_cache(maxsize=1)
+def find_system_fonts() -> Dict[str, str]:
+    """Returns font files of the system by normalized file names, family and full font names"""
+    fonts, families = {}, {}
+    for font_dir in FONT_DIRS:
+        font_dir = Path(font_dir).expanduser()
+        if not font_dir.is_dir():
+            continue
+        for path in sorted(font_dir.rglob("*")):
+            if path.suffix.lower() not in FONT_SUFFIXES:
+                continue
+            fonts.setdefault(normalize_font_name(path.stem), str(path))
+            try:
+                font = TTFont(str(path), lazy=True, fontNumber=0)
+                full_name = font["name"].getDebugName(4)
+                family = font["name"].getDebugName(1)
+                font.close()
+            except (TTLibError, OSError, KeyError) as e:
+                logger.debug("Failed to read font names of {}: {}".format(path, e))
+                continue
+            if full_name:
+                fonts.setdefault(normalize_font_name(full_name), str(path))
+            if family:
+                families.setdefault(normalize_font_name(family), []).append(str(path))
+
+    # a family name means its regular font, the one with the full name equal to the family name
+    for family, paths in families.items():
+        fonts.setdefault(family, paths[0])
+    return fonts
+
+
+@lru_cache(maxsize=64)
+def font_coverage(font_path: str) -> FrozenSet[int]:
+    """Returns code points with glyphs in the font"""
+    try:
+        font = TTFont(font_path, lazy=True, fontNumber=0)
+        coverage = frozenset(font.getBestCmap() or {})
+        font.close()
+    except (TTLibError, OSError) as e:
+        logger.warning("Failed to read glyphs of font {}: {}".format(font_path, e))
+        return frozenset()
+    return coverage
+
+
+@dataclass
+class TextStyle:
+    """Slogan style, the options of BannerGenerator: font, text_shadow and text_background.
+
+    The font is a font name or a font file path. The font size is fitted to the text box
+    when it is not set, the color contrasting with the box background is used by default.
+    """
+
+    font: str = "Arial"
+    font_size: Optional[int] = None
+    color: Optional[str | Tuple[int, int, int]] = None
+    text_shadow: Optional[int] = None
+    text_background: bool = False
+    line_spacing: float = 1.2
+    padding: float = 0.05
+    min_font_size: int = 10
+
+
+class BannerCompositor:
+    """Browserless renderer which draws the slogan over the image in the known text box.
+
+    It is the fast path for a one line or a few lines slogan when the text box is known,
+    e.g. from RemoveTextTool, and takes milliseconds instead of a browser page load.
+    Images are saved to the images directory of the work dir, like BannerHtmlRenderer does.
+    """
+
+    def __init__(
+        self,
+        work_dir: str,
+        window_size: Optional[Tuple[int, int]] = None,
+        save_to_disk: bool = True,
+        image_format: str = "png",
+        fallback_fonts: Tuple[str, ...] = FALLBACK_FONTS,
+        max_cached_backgrounds: int = 4,
+        stats: RenderStats | None = None,
+    ):
+        self.work_dir = Path(work_dir).resolve()
+        self.images_dir = self.work_dir / "images"
+        self.window_size = window_size
+        self.save_to_disk = save_to_disk
+        # jpeg is encoded several times faster than png
+        self.image_format = image_format.lower()
+        self.fallback_fonts = fallback_fonts
+        self.stats = stats or get_render_stats()
+        # review iterations draw over the same image, it is decoded and resized once
+        self.max_cached_backgrounds = max_cached_backgrounds
+        self.__backgrounds: OrderedDict[tuple, Image.Image] = OrderedDict()
+        self.__backgrounds_lock = Lock()
+
+    def render_image(
+        self,
+        image_path: str,
+        slogan: str,
+        box: Tuple[int, int, int, int],
+        style: TextStyle | None = None,
+        file_name: str | None = None,
+    ) -> str | bytes:
+        """Draws the slogan over the image
+
+        Args:
+            image_path (str): background image path
+            slogan (str): slogan text
+            box (tuple): text box (x, y, width, height) in the image pixels
+            style (TextStyle): slogan style
+            file_name (str): file name with not extension
+
+        Returns:
+            file path to created image, encoded image bytes if the compositor does not save to disk
+        """
+        image = self.render_image_bytes(image_path, slogan, box, style)
+        if not self.save_to_disk:
+            return image
+
+        with self.stats.timer("compose.write"):
+            self.images_dir.mkdir(parents=True, exist_ok=True)
+            file_name = file_name or "{}_{}".format(
+                datetime.now().strftime("%Y_%m_%d__%H_%M_%S_%f"), uuid.uuid4().hex[:8]
+            )
+            image_ext = "jpg" if self.image_format == "jpeg" else self.image_format
+            output_path = self.images_dir / "{}.{}".format(file_name, image_ext)
+            with open(output_path, "wb") as f:
+                f.write(image)
+        logger.info("Saved the composited banner to {}".format(output_path))
+        return str(output_path)
+
+    def render_image_bytes(
+        self, image_path: str, slogan: str, box: Tuple[int, int, int, int], style: TextStyle | None = None
+    ) -> bytes:
+        """Draws the slogan over the image and returns encoded image bytes"""
+        style = style or TextStyle()
+        with self.stats.timer("compose"):
+            background, box = self.load_background(image_path, box)
+            banner = self.compose(background, slogan, box, style).convert("RGB")
+
+            buffer = io.BytesIO()
+            if self.image_format == "png":
+                banner.save(buffer, "PNG", compress_level=1)
+            else:
+                banner.save(buffer, self.image_format.upper(), quality=90)
+        return buffer.getvalue()
+
+    def load_background(self, image_path: str, box: Tuple[int, int, int, int]) -> tuple:
+        """Returns a copy of the RGBA image fitted to the window and the moved text box"""
+        key = (os.path.abspath(image_path), os.path.getmtime(image_path), self.window_size)
+        with self.__backgrounds_lock:
+            background = self.__backgrounds.get(key)
+            if background is not None:
+                self.__backgrounds.move_to_end(key)
+
+        if background is None:
+            background = self.fit_window(Image.open(image_path).convert("RGB")).convert("RGBA")
+            with self.__backgrounds_lock:
+                self.__backgrounds[key] = background
+                while len(self.__backgrounds) > self.max_cached_backgrounds:
+                    self.__backgrounds.popitem(last=False)
+
+        source_size = Image.open(image_path).size
+        return background.copy(), self.fit_box(source_size, box)
+
+    def compose(self, background: Image.Image, slogan: str, box: Tuple[int, int, int, int], style: TextStyle):
+        x, y, width, height = box
+        padding = int(round(min(width, height) * style.padding))
+        inner_width, inner_height = max(1, width - 2 * padding), max(1, height - 2 * padding)
+
+        font_path = self.find_font(style.font, slogan)
+        font_size = style.font_size or self.fit_font_size(font_path, slogan, inner_width, inner_height, style)
+        font = ImageFont.truetype(font_path, font_size)
+        lines = self.wrap_text(font, slogan, inner_width)
+        line_height = int(round(font_size * style.line_spacing))
+
+        box_color = ImageStat.Stat(background.crop((x, y, x + width, y + height)).convert("RGB")).median
+        text_color = self.parse_color(style.color) if style.color else self.contrasting_color(box_color)
+
+        # the text block is centered in the box
+        text_width = max(font.getlength(line) for line in lines)
+        text_height = line_height * len(lines)
+        text_x = x + (width - text_width) / 2
+        text_y = y + (height - text_height) / 2
+
+        # layers cover only the text block, blur and blending of the whole image take most of the time
+        frame_padding = max(4, font_size // 3) if style.text_background else 0
+        margin = frame_padding + 2 * (style.text_shadow or 0) + font_size
+        left, top = max(0, int(text_x) - margin), max(0, int(text_y) - margin)
+        right = min(background.width, int(text_x + text_width) + margin)
+        bottom = min(background.height, int(text_y + text_height) + margin)
+        layer_size = (max(1, right - left), max(1, bottom - top))
+        text_x, text_y = text_x - left, text_y - top
+
+        if style.text_background:
+            layer = Image.new("RGBA", layer_size, (0, 0, 0, 0))
+            frame_color = (*self.contrasting_color(text_color), 170)
+            frame_box = (
+                text_x - frame_padding,
+                text_y - frame_padding,
+                text_x + text_width + frame_padding,
+                text_y + text_height + frame_padding,
+            )
+            ImageDraw.Draw(layer).rounded_rectangle(frame_box, radius=frame_padding, fill=frame_color)
+            background.alpha_composite(layer, (left, top))
+
+        if style.text_shadow:
+            layer = Image.new("RGBA", layer_size, (0, 0, 0, 0))
+            shadow_color = (*self.contrasting_color(text_color), 200)
+            self.draw_lines(
+                layer, font, lines, text_x, text_y, line_height, text_width, shadow_color, offset=style.text_shadow
+            )
+            layer = layer.filter(ImageFilter.GaussianBlur(style.text_shadow / 2))
+            background.alpha_composite(layer, (left, top))
+
+        layer = Image.new("RGBA", layer_size, (0, 0, 0, 0))
+        self.draw_lines(layer, font, lines, text_x, text_y, line_height, text_width, (*text_color, 255))
+        background.alpha_composite(layer, (left, top))
+        return background
+
+    @staticmethod
+    def draw_lines(
+        layer: Image.Image,
+        font: ImageFont.FreeTypeFont,
+        lines: List[str],
+        x: float,
+        y: float,
+        line_height: int,
+        block_width: float,
+        color: tuple,
+        offset: int = 0,
+    ):
+        draw = ImageDraw.Draw(layer)
+        for i, line in enumerate(lines):
+            line_x = x + (block_width - font.getlength(line)) / 2 + offset
+            line_y = y + i * line_height + line_height / 2 + offset
+            draw.text((line_x, line_y), line, font=font, fill=color, anchor="lm")
+
+    def fit_window(self, background: Image.Image) -> Image.Image:
+        """Scales and crops the image to the window size like css background-size: cover"""
+        if not self.window_size or background.size == tuple(self.window_size):
+            return background
+
+        width, height = self.window_size
+        scale, left, top = self.__cover_transform(background.size)
+        # only the visible part of the image is resized
+        source_box = (left / scale, top / scale, (left + width) / scale, (top + height) / scale)
+        return background.resize((width, height), Image.BICUBIC, box=source_box, reducing_gap=2.0)
+
+    def fit_box(self, image_size: Tuple[int, int], box: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """Moves the text box of the image to the image fitted to the window"""
+        if not self.window_size or tuple(image_size) == tuple(self.window_size):
+            return box
+
+        scale, left, top = self.__cover_transform(image_size)
+        x, y, width, height = box
+        return (
+            int(round(x * scale - left)),
+            int(round(y * scale - top)),
+            int(round(width * scale)),
+            int(round(height * scale)),
+        )
+
+    def __cover_transform(self, image_size: Tuple[int, int]) -> Tuple[float, int, int]:
+        width, height = self.window_size
+        w, h = image_size
+        scale = max(width / w, height / h)
+        left = (max(width, round(w * scale)) - width) // 2
+        top = (max(height, round(h * scale)) - height) // 2
+        return scale, left, top
+
+    def find_font(self, font: str, text: str) -> str:
+        """Returns the font file covering all characters of the text.
+
+        Cyrillic and other characters missing in the font are taken from the first
+        fallback font covering the whole text, the font covering the most characters is
+        used when there is no such font.
+        """
+        code_points = {ord(c) for c in text if not c.isspace()}
+        candidates = [font] + [name for name in self.fallback_fonts if name != font]
+
+        best_path, best_coverage = None, -1
+        for name in candidates:
+            path = name if os.path.isfile(name) else find_system_fonts().get(normalize_font_name(name))
+            if path is None:
+                continue
+            coverage = len(code_points & font_coverage(path))
+            if coverage == len(code_points):
+                if name != font:
+                    logger.info("Font {} does not cover the text, fallback font {} is used".format(font, name))
+                return path
+            if coverage > best_coverage:
+                best_path, best_coverage = path, coverage
+
+        if best_path is None:
+            raise FileNotFoundError("Neither font {} nor fallback fonts are found".format(font))
+        logger.warning("No font covers all characters of the text, {} is used".format(best_path))
+        return best_path
+
+    def fit_font_size(self, font_path: str, text: str, width: int, height: int, style: TextStyle) -> int:
+        """Returns the largest font size the wrapped text fits the box with"""
+        low, high = style.min_font_size, max(style.min_font_size, height)
+        while low < high:
+            size = (low + high + 1) // 2
+            font = ImageFont.truetype(font_path, size)
+            lines = self.wrap_text(font, text, width)
+            fits_width = max(font.getlength(line) for line in lines) <= width
+            fits_height = len(lines) * size * style.line_spacing <= height
+            if fits_width and fits_height:
+                low = size
+            else:
+                high = size - 1
+        return low
+
+    @staticmethod
+    def wrap_text(font: ImageFont.FreeTypeFont, text: str, width: int) -> List[str]:
+        """Splits the text into lines not wider than width, a single long word takes its own line"""
+        lines = []
+        for paragraph in text.splitlines() or [text]:
+            line = ""
+            for word in paragraph.split():
+                candidate = "{} {}".format(line, word) if line else word
+                if line and font.getlength(candidate) > width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            lines.append(line)
+        return lines
+
+    @staticmethod
+    def parse_color(color: str | Tuple[int, int, int]) -> Tuple[int, int, int]:
+        if isinstance(color, str):
+            return ImageColor.getrgb(color)[:3]
+        return tuple(int(c) for c in color[:3])
+
+    @staticmethod
+    def contrasting_color(color: Tuple[float, float, float]) -> Tuple[int, int, int]:
+        """Returns black or white, the one with better contrast with the color"""
+        white, black = (255, 255, 255), (0, 0, 0)
+        return white if contrast_ratio(color, white) >= contrast_ratio(color, black) else black
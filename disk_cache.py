@@ -0,0 +1,147 @@
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, List
+
+from motleycrew.common import logger
+
+
+class DiskCache:
+    """Disk store of byte entries by key, one file per entry.
+
+    Entries are evicted in LRU order when the cache size exceeds max_size bytes,
+    the file modification time keeps the order between processes. Subclasses build
+    the keys, decode the entries and decide which entries are expired.
+    """
+
+    # cache name in the log messages
+    name = "Disk cache"
+
+    def __init__(self, cache_dir: str, max_size: int, entry_ext: str):
+        self.cache_dir = Path(cache_dir).resolve()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.entry_ext = entry_ext
+
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__size = 0
+        self.__entries: OrderedDict[str, int] = OrderedDict()
+        self.__load_entries()
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def stats(self) -> dict:
+        total = self.__hits + self.__misses
+        return {
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "hit_rate": self.__hits / total if total else 0.0,
+            "entries": len(self.__entries),
+            "size": self.__size,
+        }
+
+    def get(self, key: str) -> Any:
+        """Returns the decoded entry or None, broken and expired entries are removed"""
+        path = self.entry_path(key)
+        with self.__lock:
+            if key not in self.__entries:
+                self.__misses += 1
+                return None
+
+            try:
+                with open(path, "rb") as f:
+                    value = self.decode(f.read())
+                os.utime(path)
+            except (OSError, ValueError, TypeError):
+                self.__remove_entry(key)
+                self.__misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+
+        logger.info("{} hit {}".format(self.name, key))
+        return value
+
+    def put(self, key: str, data: bytes):
+        """Saves the entry bytes and evicts least recently used entries"""
+        # unique tmp file, concurrent puts of the same key must not share it
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.entry_path(key))
+
+        with self.__lock:
+            self.__size -= self.__entries.pop(key, 0)
+            self.__entries[key] = len(data)
+            self.__size += len(data)
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            for key in list(self.__entries):
+                self.__remove_entry(key)
+            self.__hits = 0
+            self.__misses = 0
+
+    def decode(self, data: bytes) -> Any:
+        """Converts the entry bytes to the cached value, raises ValueError if the entry is not valid"""
+        return data
+
+    def is_expired(self, created_at: float) -> bool:
+        """Entries saved at the created_at timestamp are not returned and removed on load"""
+        return False
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / "{}.{}".format(key, self.entry_ext)
+
+    def entry_files(self, key: str) -> List[Path]:
+        """Returns all files of the entry, they are removed together"""
+        return [self.entry_path(key)]
+
+    def __evict(self):
+        while self.__size > self.max_size and len(self.__entries) > 1:
+            key = next(iter(self.__entries))
+            self.__remove_entry(key)
+
+    def __remove_entry(self, key: str):
+        self.__size -= self.__entries.pop(key)
+        for path in self.entry_files(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __load_entries(self):
+        entries = []
+        for path in self.cache_dir.glob("*.{}".format(self.entry_ext)):
+            stat = path.stat()
+            if self.is_expired(stat.st_mtime):
+                for entry_file in self.entry_files(path.stem):
+                    try:
+                        os.remove(entry_file)
+                    except OSError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self.__entries[key] = size
+            self.__size += size
+
+        with self.__lock:
+            self.__evict()
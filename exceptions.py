@@ -6,3 +6,21 @@ class RunStopException(Exception):
 
 class GeneratorIsRunException(Exception):
     pass
+
+
+class RenderServerException(Exception):
+    pass
+
+
+REVIEW_TIMEOUT_APPROVE = "approve"
+REVIEW_TIMEOUT_ABORT = "abort"
+REVIEW_TIMEOUT_BEST = "best"
+REVIEW_TIMEOUT_POLICIES = (REVIEW_TIMEOUT_APPROVE, REVIEW_TIMEOUT_ABORT, REVIEW_TIMEOUT_BEST)
+
+
+class ReviewTimeoutException(RunStopException):
+    """Human review is not received in time, the policy tells the generator how to go on"""
+
+    def __init__(self, message: str, policy: str = REVIEW_TIMEOUT_ABORT):
+        super().__init__(message)
+        self.policy = policy
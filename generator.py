@@ -12,6 +12,7 @@ from viewers import CliImageViewer
 from motleycrew import MotleyCrew
 from checkers import BaseChecker
 from output_handler import HtmlRenderOutputHandler
+from scratchpad import ScratchpadCompactor
 
 
 class BaseBannerGenerator:
@@ -27,6 +28,7 @@ class BaseBannerGenerator:
         image_size: Tuple[int, int] = (1024, 1024),
         max_review_iterations: int = 5,
         image_generate_tool: MotleyTool = None,
+        num_html_variants: int = 1,
     ):
         self.crew = MotleyCrew()
         self.image_description = image_description
@@ -42,7 +44,19 @@ class BaseBannerGenerator:
                 window_size=self.image_size,
                 slogan=self.slogan,
                 max_iterations=max_review_iterations,
+                num_variants=num_html_variants,
             )
+            # stale html attempts and tool outputs are compacted before they are sent to the llm again
+            self.scratchpad_compactor = ScratchpadCompactor(output_handler_name=self.html_render_output_handler._name)
+
+        # several html variants in one agent response save llm round trips, the best one is kept
+        if num_html_variants > 1:
+            self.html_variants_description = (
+                " Make up {} different variants of the html code and pass all of them to the output handler "
+                "in one call, one complete html document after another.".format(num_html_variants)
+            )
+        else:
+            self.html_variants_description = ""
 
         if not image_generate_tool:
             dalle_image_size = "{}x{}".format(image_size[0], image_size[1])
@@ -87,6 +101,7 @@ class GptBannerGenerator(BaseBannerGenerator):
         html_render_checkers: List[BaseChecker] = None,
         image_size: Tuple[int, int] = (1024, 1024),
         max_review_iterations: int = 5,
+        num_html_variants: int = 1,
     ):
         super().__init__(
             image_description,
@@ -95,6 +110,7 @@ class GptBannerGenerator(BaseBannerGenerator):
             html_render_checkers,
             image_size,
             max_review_iterations,
+            num_html_variants=num_html_variants,
         )
 
         if self.slogan:
@@ -113,13 +129,14 @@ class GptBannerGenerator(BaseBannerGenerator):
                 verbose=True,
                 tools=[html_recommend_tool],
                 output_handler=self.html_render_output_handler,
+                intermediate_steps_processor=self.scratchpad_compactor,
             )
 
             create_html_image = SimpleTask(
                 crew=self.crew,
                 name="Create html screenshot",
                 description=f"Make up html code ,the background of which will be the resulting image"
-                f"and place the text '{self.slogan}' in the foreground",
+                f"and place the text '{self.slogan}' in the foreground{self.html_variants_description}",
                 agent=self.html_developer,
             )
             self.generate_banner_task >> create_html_image
@@ -139,6 +156,7 @@ class BannerGenerator(BaseBannerGenerator):
         text_background: bool = False,
         max_review_iterations: int = 5,
         image_generate_tool: MotleyTool = None,
+        num_html_variants: int = 1,
     ):
 
         super().__init__(
@@ -148,7 +166,8 @@ class BannerGenerator(BaseBannerGenerator):
             html_render_checkers,
             image_size,
             max_review_iterations,
-            image_generate_tool
+            image_generate_tool,
+            num_html_variants,
         )
         self.font = font
         self.text_shadow = text_shadow
@@ -168,6 +187,7 @@ class BannerGenerator(BaseBannerGenerator):
                 verbose=True,
                 tools=[image_info_tool],
                 output_handler=self.html_render_output_handler,
+                intermediate_steps_processor=self.scratchpad_compactor,
             )
             font_description = "make text font ({}),".format(self.font) if self.font else ""
             text_shadow_description = (
@@ -183,7 +203,7 @@ class BannerGenerator(BaseBannerGenerator):
                 f"and place the text '{self.slogan}' in the foreground in SLOGAN LOCATION, "
                 f"make the text size  large, text padding center, {font_description} "
                 f"{text_shadow_description}, {text_background_description} make the text color contrasting "
-                f"with main color of the image, don't use scrolling on the page, ",
+                f"with main color of the image, don't use scrolling on the page, {self.html_variants_description}",
                 agent=self.html_developer,
             )
             self.generate_banner_task >> create_html_image
@@ -202,6 +222,7 @@ class BannerGeneratorWithText(BaseBannerGenerator):
         image_size: Tuple[int, int] = (1024, 1024),
         max_review_iterations: int = 5,
         image_generate_tool: MotleyTool = None,
+        num_html_variants: int = 1,
     ):
         image_description = '''{}.
         Include text "{}" in the image , with next description "{}"'''.format(
@@ -215,6 +236,7 @@ class BannerGeneratorWithText(BaseBannerGenerator):
             image_size,
             max_review_iterations,
             image_generate_tool,
+            num_html_variants,
         )
 
         self.html_recommend_tool = HtmlSloganRecommendTool(slogan=self.slogan)
@@ -233,13 +255,14 @@ class BannerGeneratorWithText(BaseBannerGenerator):
             verbose=True,
             tools=[remove_text_tool, self.html_recommend_tool],
             output_handler=self.html_render_output_handler,
+            intermediate_steps_processor=self.scratchpad_compactor,
         )
         create_html_image = SimpleTask(
             crew=self.crew,
             name="Create html screenshot",
             description=f"Remove text from the resulting image and make up html code ,the background of "
             f"which will be the cleared image and place the text '{self.slogan}' in the foreground."
-            f"Place the text in the coordinates of the deleted text",
+            f"Place the text in the coordinates of the deleted text.{self.html_variants_description}",
             agent=self.html_developer,
         )
         self.generate_banner_task >> create_html_image
@@ -0,0 +1,185 @@
+import html as html_lib
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+
+PATCH_PATTERN = re.compile(r"<patch>(.*?)(?:</patch>|$)", re.IGNORECASE | re.DOTALL)
+CSS_RULE_PATTERN = re.compile(r"([^{}]+)\{([^{}]*)\}")
+IMPORTANT_PATTERN = re.compile(r"!\s*important\s*$", re.IGNORECASE)
+SELECTOR_PATTERN = re.compile(r"^([a-zA-Z][\w-]*)?(#[\w-]+)?((?:\.[\w-]+)*)$")
+ATTR_LINE_PATTERN = re.compile(
+    r"""^@attr\s+(\S+)\s+([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|(\S+))\s*$""", re.IGNORECASE
+)
+
+PATCH_HINT = (
+    "To fix the remarks you can send only a patch of the last html code instead of the whole code: "
+    '<patch> css rules, they override the page styles; @attr <tag#id.class selector> <attribute>="<value>" '
+    "lines set attributes </patch>"
+)
+
+
+@dataclass
+class HtmlPatch:
+    """Css rules added to the page and (selector, attribute, value) changes of elements attributes"""
+
+    css: str = ""
+    attributes: List[Tuple[str, str, str]] = field(default_factory=list)
+
+
+def is_html_patch(text: str) -> bool:
+    return bool(PATCH_PATTERN.search(text))
+
+
+def parse_html_patch(text: str) -> HtmlPatch:
+    """Parses the <patch> block of the agent output
+
+    Raises:
+        ValueError: the patch is empty or malformed
+    """
+    match = PATCH_PATTERN.search(text)
+    if match is None:
+        raise ValueError("Patch block <patch>...</patch> not found")
+
+    patch = HtmlPatch()
+    css_lines = []
+    for line in match.group(1).strip().splitlines():
+        if not line.strip().lower().startswith("@attr"):
+            css_lines.append(line)
+            continue
+
+        attr_match = ATTR_LINE_PATTERN.match(line.strip())
+        if attr_match is None:
+            raise ValueError('Wrong attribute line "{}", use @attr selector name="value"'.format(line.strip()))
+        selector, name, *values = attr_match.groups()
+        value = next(v for v in values if v is not None)
+        patch.attributes.append((selector, name.lower(), value))
+
+    patch.css = "\n".join(css_lines).strip()
+    if patch.css.count("{") != patch.css.count("}"):
+        raise ValueError("Css rules of the patch have unbalanced braces")
+    if patch.css and not CSS_RULE_PATTERN.search(patch.css):
+        raise ValueError("Css rules of the patch not found")
+    if not patch.css and not patch.attributes:
+        raise ValueError("The patch is empty")
+    return patch
+
+
+def apply_html_patch(html: str, patch: HtmlPatch) -> str:
+    """Applies the patch to the html code
+
+    Raises:
+        ValueError: a selector of the patch matches no element
+    """
+    for selector, name, value in patch.attributes:
+        html = set_attribute(html, selector, name, value)
+    if patch.css:
+        html = add_css(html, patch.css)
+    return html
+
+
+def make_important(css: str) -> str:
+    """Adds !important to css declarations, so the patch overrides inline styles"""
+
+    def replace_rule(match: re.Match) -> str:
+        declarations = []
+        for declaration in split_declarations(match.group(2)):
+            if ":" not in declaration:
+                continue
+            if not IMPORTANT_PATTERN.search(declaration):
+                declaration += " !important"
+            declarations.append(declaration)
+        return "{} {{ {}; }}".format(match.group(1).strip(), "; ".join(declarations))
+
+    return CSS_RULE_PATTERN.sub(replace_rule, css)
+
+
+def split_declarations(block: str) -> List[str]:
+    """Splits css declarations by semicolons outside of quotes and parentheses, e.g. of data urls"""
+    declarations = []
+    start, depth, quote = 0, 0, None
+    for i, char in enumerate(block):
+        if quote is not None:
+            if char == quote and block[i - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif char == ";" and depth == 0:
+            declarations.append(block[start:i])
+            start = i + 1
+    declarations.append(block[start:])
+    return [d.strip() for d in declarations if d.strip()]
+
+
+def add_css(html: str, css: str) -> str:
+    style = '<style data-patch="true">\n{}\n</style>'.format(make_important(css))
+    head_close = re.search(r"</head\s*>", html, re.IGNORECASE)
+    if head_close:
+        return html[: head_close.start()] + style + "\n" + html[head_close.start():]
+
+    body_open = re.search(r"<body\b[^>]*>", html, re.IGNORECASE)
+    if body_open:
+        return html[: body_open.end()] + "\n" + style + html[body_open.end():]
+    return style + "\n" + html
+
+
+class StartTagsParser(HTMLParser):
+    """Collects start tags with their attributes and positions in the html code"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags: List[Tuple[str, dict, Tuple[int, int], str]] = []
+
+    def handle_starttag(self, tag: str, attrs: list):
+        self.tags.append((tag, dict(attrs), self.getpos(), self.get_starttag_text()))
+
+    def handle_startendtag(self, tag: str, attrs: list):
+        self.handle_starttag(tag, attrs)
+
+
+def match_selector(selector: str, tag: str, attrs: dict) -> bool:
+    match = SELECTOR_PATTERN.match(selector)
+    if match is None:
+        raise ValueError("Unsupported selector {}, use tag, #id, .class or their combination".format(selector))
+    tag_name, element_id, classes = match.groups()
+    if tag_name and tag_name.lower() != tag:
+        return False
+    if element_id and attrs.get("id") != element_id[1:]:
+        return False
+    element_classes = (attrs.get("class") or "").split()
+    return all(c in element_classes for c in classes.split(".") if c)
+
+
+def set_attribute(html: str, selector: str, name: str, value: str) -> str:
+    parser = StartTagsParser()
+    parser.feed(html)
+    parser.close()
+
+    line_offsets = [0]
+    for line in html.splitlines(keepends=True):
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    replacements = []
+    for tag, attrs, (line, column), tag_text in parser.tags:
+        if not match_selector(selector, tag, attrs):
+            continue
+        attrs[name] = value
+        attrs_text = "".join(
+            " {}".format(k) if v is None else ' {}="{}"'.format(k, html_lib.escape(v, quote=True))
+            for k, v in attrs.items()
+        )
+        closing = "/>" if tag_text.rstrip().endswith("/>") else ">"
+        start = line_offsets[line - 1] + column
+        replacements.append((start, start + len(tag_text), "<{}{}{}".format(tag, attrs_text, closing)))
+
+    if not replacements:
+        raise ValueError("Selector {} matches no element of the last html code".format(selector))
+
+    for start, end, tag_text in reversed(replacements):
+        html = html[:start] + tag_text + html[end:]
+    return html
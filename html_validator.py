@@ -0,0 +1,152 @@
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from render_cache import resolve_local_reference
+
+
+CSS_URL_PATTERN = re.compile(r"""url\(\s*["']?([^"')]+)["']?\s*\)""", re.IGNORECASE)
+CSS_DIMENSION_PATTERN = re.compile(
+    r"""(?<![\w-])((?:min-|max-)?(?:width|height))\s*:\s*([\d.]+)\s*(px|vw|vh)\b""", re.IGNORECASE
+)
+# conditions of @media, @supports and @container, e.g. (min-width: 1200px), are not page sizes
+CSS_AT_RULE_PRELUDE_PATTERN = re.compile(r"@[\w-]+[^{};]*")
+NOT_TEXT_TAGS = ("script", "style", "noscript", "template")
+HTML_DOCUMENT_PATTERN = re.compile(r"(?:<!doctype\s+html[^>]*>\s*)?<html\b.*?</html\s*>", re.IGNORECASE | re.DOTALL)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases the text, removes quotes and collapses whitespace"""
+    text = re.sub(r"""["'«»“”‘’]""", "", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def split_html_documents(text: str) -> List[str]:
+    """Returns the html documents of the text, the text itself if it has no complete documents"""
+    documents = [match.group(0) for match in HTML_DOCUMENT_PATTERN.finditer(text)]
+    return documents or [text]
+
+
+class BannerHtmlParser(HTMLParser):
+    """Collects visible text, image references and css of the banner html code"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.texts: List[str] = []
+        self.image_sources: List[str] = []
+        self.styles: List[str] = []
+        self.dimension_attrs: List[Tuple[str, str, str]] = []
+        self.__not_text_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: list):
+        attrs = dict(attrs)
+        if tag in NOT_TEXT_TAGS:
+            self.__not_text_depth += 1
+        if tag == "img" and attrs.get("src"):
+            self.image_sources.append(attrs["src"])
+        if attrs.get("style"):
+            self.styles.append(attrs["style"])
+        for name in ("width", "height"):
+            if attrs.get(name):
+                self.dimension_attrs.append((tag, name, attrs[name]))
+
+    def handle_startendtag(self, tag: str, attrs: list):
+        # void elements do not change the text depth
+        is_not_text = tag in NOT_TEXT_TAGS
+        self.handle_starttag(tag, attrs)
+        if is_not_text:
+            self.__not_text_depth -= 1
+
+    def handle_endtag(self, tag: str):
+        if tag in NOT_TEXT_TAGS and self.__not_text_depth > 0:
+            self.__not_text_depth -= 1
+
+    def handle_data(self, data: str):
+        if self.lasttag == "style" and self.__not_text_depth > 0:
+            self.styles.append(data)
+        elif self.__not_text_depth == 0:
+            self.texts.append(data)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.texts)
+
+
+class HtmlStaticValidator:
+    """Checks the banner html code before rendering.
+
+    The slogan must be in the page text, referenced local images must exist and use
+    forward slashes, and fixed css sizes must fit the window, so the page does not scroll.
+    """
+
+    def __init__(
+        self,
+        slogan: Optional[str] = None,
+        window_size: Optional[Tuple[int, int]] = None,
+        base_dir: str | Path | None = None,
+    ):
+        self.slogan = slogan
+        self.window_size = window_size
+        self.base_dir = base_dir
+
+    def validate(self, html: str) -> List[str]:
+        """Returns the found problems, an empty list if the html code is valid"""
+        parser = BannerHtmlParser()
+        parser.feed(html)
+        parser.close()
+
+        problems = []
+        if self.slogan and normalize_text(self.slogan) not in normalize_text(parser.text):
+            problems.append('the slogan "{}" is not found in the page text'.format(self.slogan))
+
+        references = list(parser.image_sources)
+        for style in parser.styles:
+            references.extend(CSS_URL_PATTERN.findall(style))
+        for reference in dict.fromkeys(references):
+            problems.extend(self.__check_reference(reference))
+
+        if self.window_size:
+            for style in parser.styles:
+                for name, value, unit in CSS_DIMENSION_PATTERN.findall(CSS_AT_RULE_PRELUDE_PATTERN.sub("", style)):
+                    problems.extend(self.__check_dimension(name, float(value), unit.lower()))
+            for tag, name, value in parser.dimension_attrs:
+                if tag != "img" or not re.fullmatch(r"\s*[\d.]+\s*(px)?\s*", value):
+                    continue
+                problems.extend(self.__check_dimension(name, float(value.strip().rstrip("px")), "px", tag))
+
+        return problems
+
+    def __check_reference(self, reference: str) -> List[str]:
+        path = resolve_local_reference(reference, self.base_dir)
+        if path is None:
+            return []
+
+        if "\\" in reference:
+            return ['use only forward slashes "/" in the image path {}'.format(reference)]
+        if not path.is_file():
+            return ["the image file {} does not exist".format(reference)]
+        return []
+
+    def __check_dimension(self, name: str, value: float, unit: str, tag: str | None = None) -> List[str]:
+        # max sizes do not make the page larger
+        if name.lower().startswith("max-"):
+            return []
+
+        width, height = self.window_size
+        is_width = name.lower().endswith("width")
+        if unit == "px":
+            limit = width if is_width else height
+        elif unit == ("vw" if is_width else "vh"):
+            limit = 100
+        else:
+            return []
+
+        if value <= limit:
+            return []
+        where = "{} attribute of <{}>".format(name, tag) if tag else "css {}".format(name)
+        return [
+            "{} {:g}{} is larger than the banner size {}x{}, the page will scroll".format(
+                where, value, unit, width, height
+            )
+        ]
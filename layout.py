@@ -0,0 +1,108 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from playwright.async_api import Page
+
+
+# finds the smallest element containing the whole slogan and measures it
+EXTRACT_LAYOUT_JS = """
+(slogan) => {
+    const normalize = (text) => (text || "").replace(/\\s+/g, " ").trim().toLowerCase();
+    const doc = document.documentElement;
+    const body = document.body;
+    const report = {
+        viewport_width: window.innerWidth,
+        viewport_height: window.innerHeight,
+        page_width: Math.max(doc.scrollWidth, body ? body.scrollWidth : 0),
+        page_height: Math.max(doc.scrollHeight, body ? body.scrollHeight : 0),
+        slogan_found: false,
+    };
+
+    const target = normalize(slogan);
+    if (!target || !body) {
+        return report;
+    }
+
+    let element = null;
+    let elementTextLength = Infinity;
+    for (const el of [body, ...body.querySelectorAll("*")]) {
+        if (["SCRIPT", "STYLE", "NOSCRIPT"].includes(el.tagName)) {
+            continue;
+        }
+        const text = normalize(el.innerText || el.textContent);
+        if (text.includes(target) && text.length <= elementTextLength) {
+            element = el;
+            elementTextLength = text.length;
+        }
+    }
+    if (!element) {
+        return report;
+    }
+
+    const toBox = (rect) => [rect.x, rect.y, rect.width, rect.height];
+    const range = document.createRange();
+    range.selectNodeContents(element);
+    const style = window.getComputedStyle(element);
+    const isInline = style.display === "inline";
+
+    report.slogan_found = true;
+    report.tag = element.tagName.toLowerCase();
+    report.box = toBox(element.getBoundingClientRect());
+    report.text_boxes = Array.from(range.getClientRects())
+        .filter((rect) => rect.width > 0 && rect.height > 0)
+        .map(toBox);
+    report.font_size = parseFloat(style.fontSize);
+    report.font_family = style.fontFamily;
+    report.color = style.color;
+    report.is_overflowing = !isInline && (
+        element.scrollWidth > element.clientWidth + 1 || element.scrollHeight > element.clientHeight + 1
+    );
+    return report;
+}
+"""
+
+
+@dataclass
+class LayoutReport:
+    """Slogan geometry of the rendered page, boxes are (x, y, width, height) in css pixels"""
+
+    viewport_width: int
+    viewport_height: int
+    page_width: int
+    page_height: int
+    slogan_found: bool = False
+    tag: Optional[str] = None
+    box: Optional[Tuple[float, float, float, float]] = None
+    text_boxes: List[Tuple[float, float, float, float]] = field(default_factory=list)
+    font_size: Optional[float] = None
+    font_family: Optional[str] = None
+    color: Optional[str] = None
+    is_overflowing: bool = False
+
+    @property
+    def is_scrolling(self) -> bool:
+        return self.page_width > self.viewport_width or self.page_height > self.viewport_height
+
+    @property
+    def is_clipped(self) -> bool:
+        """Slogan text is partly out of the viewport"""
+        for x, y, w, h in self.text_boxes:
+            if x < 0 or y < 0 or x + w > self.viewport_width or y + h > self.viewport_height:
+                return True
+        return False
+
+    @property
+    def num_lines(self) -> int:
+        return len({round(y) for _, y, _, _ in self.text_boxes})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LayoutReport":
+        data = dict(data)
+        data["box"] = tuple(data["box"]) if data.get("box") else None
+        data["text_boxes"] = [tuple(box) for box in data.get("text_boxes") or []]
+        return cls(**data)
+
+
+async def extract_layout(page: Page, slogan: str) -> LayoutReport:
+    """Measures the element containing the slogan on the loaded page"""
+    return LayoutReport.from_dict(await page.evaluate(EXTRACT_LAYOUT_JS, slogan))
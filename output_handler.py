@@ -1,15 +1,35 @@
-from typing import Tuple, List, Optional, Union
+from typing import Dict, Tuple, List, Optional, Union
 from pathlib import Path
 from datetime import datetime
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 import asyncio
-import sys
+import time
+import uuid
 
 from motleycrew.common.exceptions import InvalidOutput
 from motleycrew.agents import MotleyOutputHandler
-from playwright.async_api import async_playwright
+import numpy as np
 
 
+from asset_cache import AssetCache
+from browser_pool import (
+    BrowserPool,
+    RenderRequest,
+    ScreenshotProfile,
+    CONTENT_BASE_DIR,
+    find_screenshot_profile,
+)
 from checkers import BaseChecker
+from exceptions import REVIEW_TIMEOUT_APPROVE, REVIEW_TIMEOUT_BEST, ReviewTimeoutException
+from html_patch import PATCH_HINT, apply_html_patch, is_html_patch, parse_html_patch
+from html_validator import HtmlStaticValidator, split_html_documents
+from layout import LayoutReport
+from render_cache import RenderCache
+from render_server import RenderClient, find_env_render_client
+from render_stats import RenderStats, get_render_stats
+from utils import decode_image, guess_image_format, image_thumbnail, thumbnails_difference
 from viewers import (
     BaseViewer,
     StreamLitItemQueueViewer,
@@ -23,7 +43,18 @@ from motleycrew.common import logger
 class BannerHtmlRenderer():
 
     def __init__(
-        self, work_dir: str, headless: bool = True, window_size: Optional[Tuple[int, int]] = None
+        self,
+        work_dir: str,
+        headless: bool = True,
+        window_size: Optional[Tuple[int, int]] = None,
+        browser_pool: BrowserPool | None = None,
+        render_timeout: float = 60,
+        save_to_disk: bool = True,
+        render_cache: RenderCache | None = None,
+        render_client: RenderClient | None = None,
+        asset_cache: AssetCache | None = None,
+        screenshot_profile: str | ScreenshotProfile = "final",
+        stats: RenderStats | None = None,
     ):
 
         self.work_dir = Path(work_dir).resolve()
@@ -32,69 +63,386 @@ class BannerHtmlRenderer():
         self.headless = headless
         self.window_size = window_size
         if self.window_size:
-            self.__view_size = {"width": window_size[0], "height": window_size[0]}
+            self.__view_size = {"width": window_size[0], "height": window_size[1]}
         else:
             self.__view_size = None
-        self.__changed_event_loop = False
-
-    def render_image(self, html: str, file_name: str | None = None):
+        # the render server client replaces the browser pool of the process
+        self.render_client = render_client or (None if browser_pool else find_env_render_client())
+        if self.render_client is None:
+            self.browser_pool = browser_pool or BrowserPool.get_pool(headless=headless)
+        else:
+            self.browser_pool = None
+        self.render_timeout = render_timeout
+        self.save_to_disk = save_to_disk
+        # relative references resolve from the same directory in both render modes
+        self.base_dir = self.html_dir if save_to_disk else CONTENT_BASE_DIR
+        self.render_cache = render_cache
+        self.asset_cache = asset_cache
+        self.screenshot_profile = find_screenshot_profile(screenshot_profile)
+        # stage timings, the stats shared by the process by default
+        self.stats = stats or get_render_stats()
+
+    def render_image(
+        self,
+        html: str,
+        file_name: str | None = None,
+        viewports: List[Tuple[int, int]] | None = None,
+        profile: str | ScreenshotProfile | None = None,
+    ) -> str | bytes | List[str | bytes]:
         """Create image with png extension from html code
 
         Args:
             html (str): html code for rendering image
             file_name (str): file name with not extension
+            viewports (list): (width, height) sizes, all of them are rendered from one page load
+            profile (str | ScreenshotProfile): screenshot profile, the renderer profile by default
         Returns:
-            file path to created image
+            file path to created image, png bytes if the renderer does not save to disk,
+            list of them for every viewport if viewports are set
         """
-
-        html = self.prepare_html(html)
         logger.info("Trying to render image from HTML code")
-        html_path, image_path = self.build_save_file_paths(file_name)
 
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(html)
-        logger.info("Saved the HTML code to {}".format(html_path))
+        try:
+            future = self.__submit_many(
+                [html], [file_name], viewports=viewports, save_to_disk=self.save_to_disk, profile=profile
+            )
+            image = future.result()[0]
+        except Exception as e:
+            logger.error("Failed to render image from HTML code")
+            raise e
+
+        for image_path in image if isinstance(image, list) else [image]:
+            if isinstance(image_path, str):
+                logger.info("Saved the rendered HTML screenshot to {}".format(image_path))
+        return image
 
-        logger.info("Taking screenshot")
+    def render_image_bytes(
+        self,
+        html: str,
+        viewports: List[Tuple[int, int]] | None = None,
+        profile: str | ScreenshotProfile | None = None,
+    ) -> bytes | List[bytes]:
+        """Create png image from html code without writing html and image files
+
+        Args:
+            html (str): html code for rendering image
+            viewports (list): (width, height) sizes, all of them are rendered from one page load
+            profile (str | ScreenshotProfile): screenshot profile, the renderer profile by default
+
+        Returns:
+            bytes: encoded image, list of images for every viewport if viewports are set
+        """
+        logger.info("Trying to render image from HTML code in memory")
 
         try:
-            loop = self.__find_async_loop()
-            url = "file://{}".format(html_path)
-            loop.run_until_complete(self.__render_image(url, image_path))
+            future = self.__submit_many([html], viewports=viewports, save_to_disk=False, profile=profile)
+            image = future.result()[0]
         except Exception as e:
-            logger.error("Failed to render image from HTML code {}".format(image_path))
+            logger.error("Failed to render image from HTML code in memory")
             raise e
 
-        logger.info("Saved the rendered HTML screenshot to {}".format(image_path))
+        return image
 
-        return image_path
+    def render_image_with_layout(
+        self,
+        html: str,
+        slogan: str,
+        file_name: str | None = None,
+        profile: str | ScreenshotProfile | None = None,
+        save_to_disk: bool | None = None,
+    ) -> Tuple[str | bytes, LayoutReport]:
+        """Create image from html code and measure the slogan element on the same page load
+
+        Args:
+            html (str): html code for rendering image
+            slogan (str): slogan text
+            file_name (str): file name with not extension
+            profile (str | ScreenshotProfile): screenshot profile, the renderer profile by default
+            save_to_disk (bool): write html and image files, the renderer setting by default
 
-    def __find_async_loop(self):
-        if not self.__changed_event_loop and sys.platform == "win32":
-            loop = asyncio.ProactorEventLoop()
-            asyncio.set_event_loop(loop)
-            self.__changed_event_loop = True
-            return loop
+        Returns:
+            tuple: image path or bytes and the slogan layout report
+        """
+        logger.info("Trying to render image with layout from HTML code")
+        save_to_disk = self.save_to_disk if save_to_disk is None else save_to_disk
 
         try:
-            loop = asyncio.get_running_loop()
-        except Exception:
-            loop = asyncio.new_event_loop()
+            future = self.__submit_many(
+                [html], [file_name], save_to_disk=save_to_disk, profile=profile, slogan=slogan
+            )
+            image, layout = future.result()[0]
+        except Exception as e:
+            logger.error("Failed to render image with layout from HTML code")
+            raise e
+
+        if isinstance(image, str):
+            logger.info("Saved the rendered HTML screenshot to {}".format(image))
+        return image, layout
+
+    def render_image_array(self, html: str, profile: str | ScreenshotProfile | None = None) -> np.ndarray:
+        """Create BGR image array from html code without writing html and image files"""
+        return decode_image(self.render_image_bytes(html, profile=profile))
+
+    def save_image(self, image: bytes, file_name: str | None = None) -> str:
+        """Saves image rendered in memory to the images dir
 
-        return loop
+        Args:
+            image (bytes): encoded image
+            file_name (str): file name with not extension
 
-    async def __render_image(self, url: str, image_path):
+        Returns:
+            str: image file path
+        """
+        image_ext = ScreenshotProfile(image_format=guess_image_format(image)).image_ext
+        _, image_path = self.build_save_file_paths(file_name, image_ext)
+        self.__write_image(image, image_path)
+        logger.info("Saved the rendered HTML screenshot to {}".format(image_path))
+        return image_path
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
+    def render_images(
+        self,
+        htmls: List[str],
+        file_names: List[str] | None = None,
+        concurrency: int | None = None,
+        return_exceptions: bool = False,
+        viewports: List[Tuple[int, int]] | None = None,
+        profile: str | ScreenshotProfile | None = None,
+        slogan: str | None = None,
+        save_to_disk: bool | None = None,
+    ) -> List[str | bytes | List[str | bytes] | tuple | Exception]:
+        """Create images with png extension from several html codes at once
 
-            if self.__view_size:
-                await page.set_viewport_size(self.__view_size)
+        Args:
+            htmls (list): html codes for rendering images
+            file_names (list): file names with not extension, unique names are generated by default
+            concurrency (int): max number of pages rendering at the same time
+            return_exceptions (bool): return render exceptions in place of failed image paths
+            viewports (list): (width, height) sizes rendered for every html code
+            profile (str | ScreenshotProfile): screenshot profile, the renderer profile by default
+            slogan (str): measure the slogan layout, every item is an (images, layouts) tuple then
+            save_to_disk (bool): write html and image files, the renderer setting by default
+
+        Returns:
+            list: file paths to created images (png bytes if the renderer does not save to disk)
+                in the htmls order, every item is a list of images if viewports are set
+        """
+        logger.info("Trying to render {} images from HTML code".format(len(htmls)))
+        save_to_disk = self.save_to_disk if save_to_disk is None else save_to_disk
+        future = self.__submit_many(
+            htmls, file_names, concurrency, return_exceptions, viewports, save_to_disk, profile, slogan
+        )
+        return future.result()
+
+    async def arender_many(
+        self,
+        htmls: List[str],
+        file_names: List[str] | None = None,
+        concurrency: int | None = None,
+        return_exceptions: bool = False,
+        viewports: List[Tuple[int, int]] | None = None,
+        profile: str | ScreenshotProfile | None = None,
+    ) -> List[str | bytes | List[str | bytes] | Exception]:
+        """Async version of render_images, can be awaited from any event loop"""
+        logger.info("Trying to render {} images from HTML code".format(len(htmls)))
+        future = self.__submit_many(
+            htmls, file_names, concurrency, return_exceptions, viewports, self.save_to_disk, profile
+        )
+        return await asyncio.wrap_future(future)
+
+    def __submit_many(
+        self,
+        htmls: List[str],
+        file_names: List[str | None] | None = None,
+        concurrency: int | None = None,
+        return_exceptions: bool = False,
+        viewports: List[Tuple[int, int]] | None = None,
+        save_to_disk: bool = True,
+        profile: str | ScreenshotProfile | None = None,
+        slogan: str | None = None,
+    ) -> Future:
+        """Renders html codes not found in the render cache with the browser pool or the render server
+
+        Returns:
+            Future: concurrent future with the list of outputs in the htmls order,
+                an output is a (images, layouts) tuple if the slogan is set
+        """
+        if file_names is not None and len(file_names) != len(htmls):
+            raise ValueError("Number of file names must be equal to number of html codes")
+
+        profile = find_screenshot_profile(profile) if profile else self.screenshot_profile
+
+        file_names = file_names or [None] * len(htmls)
+        if viewports:
+            view_sizes = [{"width": width, "height": height} for width, height in viewports]
+        else:
+            view_sizes = [self.__view_size]
+
+        results = [None] * len(htmls)
+        requests, requests_indexes, requests_outputs, requests_cache_keys = [], [], [], []
+
+        for i, (html, file_name) in enumerate(zip(htmls, file_names)):
+            with self.stats.timer("prepare"):
+                html = self.prepare_html(html)
+                cache_keys = [
+                    self.__build_cache_key(html, view_size, profile) for view_size in view_sizes
+                ]
+                cached = self.__get_cached_images(cache_keys, slogan)
+
+            if cached is not None:
+                images, layouts = cached
+                if save_to_disk:
+                    _, image_paths = self.__build_image_paths(file_name, view_sizes, bool(viewports), profile)
+                    with self.stats.timer("write"):
+                        for image, image_path in zip(images, image_paths):
+                            self.__write_image(image, image_path)
+                    images = image_paths
+                results[i] = self.__build_output(images, layouts, bool(viewports))
+                continue
+
+            if save_to_disk:
+                html_path, image_paths = self.__build_image_paths(file_name, view_sizes, bool(viewports), profile)
+                with self.stats.timer("write"):
+                    self.__save_html(html, html_path)
+                url = "file://{}".format(html_path)
+                request = RenderRequest(
+                    view_sizes,
+                    url=url,
+                    image_paths=image_paths,
+                    asset_cache=self.asset_cache,
+                    screenshot_profile=profile,
+                    slogan=slogan,
+                )
+            else:
+                image_paths = None
+                if not self.base_dir.exists():
+                    self.base_dir.mkdir(parents=True)
+                request = RenderRequest(
+                    view_sizes,
+                    html=html,
+                    asset_cache=self.asset_cache,
+                    screenshot_profile=profile,
+                    slogan=slogan,
+                    base_url=self.base_dir.as_uri() + "/",
+                )
+
+            requests.append(request)
+            requests_indexes.append(i)
+            requests_outputs.append(image_paths)
+            requests_cache_keys.append(cache_keys)
+
+        future = Future()
+        if not requests:
+            future.set_result(results)
+            return future
+
+        start = time.perf_counter()
+
+        def complete(requests_future: Future):
+            # exceptions of a done callback are only logged, the future must be resolved anyway
+            try:
+                self.stats.record("render", time.perf_counter() - start, num_requests=len(requests))
+                requests_results = requests_future.result()
+
+                for i, render_result, image_paths, cache_keys in zip(
+                    requests_indexes, requests_results, requests_outputs, requests_cache_keys
+                ):
+                    if isinstance(render_result, BaseException):
+                        results[i] = render_result
+                        continue
+
+                    images, layouts = render_result.images, render_result.layouts
+                    self.stats.record_many(render_result.timings)
+                    self.__put_cached_images(cache_keys, images, layouts, slogan)
+
+                    images = image_paths or images
+                    results[i] = self.__build_output(images, layouts, bool(viewports))
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(results)
+
+        backend = self.render_client or self.browser_pool
+        requests_future = backend.submit_render_requests(
+            requests, concurrency=concurrency, timeout=self.render_timeout, return_exceptions=return_exceptions
+        )
+        requests_future.add_done_callback(complete)
+        return future
+
+    def __build_cache_key(self, html: str, view_size: dict | None, profile: ScreenshotProfile) -> str | None:
+        if self.render_cache is None:
+            return None
+        # relative references are resolved from the base directory
+        return self.render_cache.build_key(html, view_size, self.base_dir, screenshot_profile=asdict(profile))
+
+    def __put_cached_images(
+        self, cache_keys: List[str | None], images: List[bytes], layouts: List[LayoutReport] | None, slogan: str | None
+    ):
+        if self.render_cache is None:
+            return
+        # the cache is an optimization, the rendered images are returned anyway
+        try:
+            for j, (cache_key, image) in enumerate(zip(cache_keys, images)):
+                meta = {"slogan": slogan, "layout": asdict(layouts[j])} if layouts else None
+                self.render_cache.put(cache_key, image, meta)
+        except Exception as e:
+            logger.warning("Failed to write render cache: {}".format(e))
+
+    def __get_cached_images(
+        self, cache_keys: List[str | None], slogan: str | None = None
+    ) -> Tuple[List[bytes], List[LayoutReport] | None] | None:
+        if self.render_cache is None:
+            return None
+
+        images, layouts = [], [] if slogan is not None else None
+        for cache_key in cache_keys:
+            if layouts is not None:
+                # the image is rendered again if the layout of the slogan was not measured
+                meta = self.render_cache.get_meta(cache_key)
+                if not meta or meta.get("slogan") != slogan:
+                    return None
+                layouts.append(LayoutReport.from_dict(meta["layout"]))
+
+            image = self.render_cache.get(cache_key)
+            if image is None:
+                return None
+            images.append(image)
+        return images, layouts
+
+    @staticmethod
+    def __build_output(images: list, layouts: list | None, is_many_views: bool):
+        if not is_many_views:
+            images = images[0]
+            layouts = layouts[0] if layouts else layouts
+        return images if layouts is None else (images, layouts)
+
+    def __build_image_paths(
+        self,
+        file_name: str | None,
+        view_sizes: List[dict | None],
+        is_size_postfix: bool,
+        profile: ScreenshotProfile,
+    ) -> Tuple[str, List[str]]:
+        html_path, image_path = self.build_save_file_paths(file_name, profile.image_ext)
+        if not is_size_postfix:
+            return html_path, [image_path]
+
+        image_path_not_ext, ext = os.path.splitext(image_path)
+        image_paths = [
+            "{}_{}x{}{}".format(image_path_not_ext, view_size["width"], view_size["height"], ext)
+            for view_size in view_sizes
+        ]
+        return html_path, image_paths
+
+    @staticmethod
+    def __save_html(html: str, html_path: str):
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        logger.info("Saved the HTML code to {}".format(html_path))
 
-            await page.goto(url)
-            await page.screenshot(path=image_path, full_page=True)
-            await browser.close()
+    @staticmethod
+    def __write_image(image: bytes, image_path: str):
+        with open(image_path, "wb") as f:
+            f.write(image)
 
     def prepare_html(self, html: str) -> str:
         """Clears the html code from unnecessary characters at the beginning and end of the code
@@ -122,11 +470,12 @@ class BannerHtmlRenderer():
 
         return html
 
-    def build_save_file_paths(self, file_name: str | None = None) -> Tuple[str, str]:
+    def build_save_file_paths(self, file_name: str | None = None, image_ext: str = "png") -> Tuple[str, str]:
         """Builds paths to html and image files
 
         Args:
             file_name (str): file name with not extension
+            image_ext (str): image file extension
 
         Returns:
             tuple[str, str]: html file path and image file path
@@ -137,13 +486,31 @@ class BannerHtmlRenderer():
             if not _dir.exists():
                 _dir.mkdir(parents=True)
 
-        file_name = file_name or datetime.now().strftime("%Y_%m_%d__%H_%M")
+        # microseconds and a random suffix keep names unique for parallel renders
+        file_name = file_name or "{}_{}".format(
+            datetime.now().strftime("%Y_%m_%d__%H_%M_%S_%f"), uuid.uuid4().hex[:8]
+        )
         html_path = self.html_dir / "{}.html".format(file_name)
-        image_path = self.images_dir / "{}.png".format(file_name)
+        image_path = self.images_dir / "{}.{}".format(file_name, image_ext)
 
         return str(html_path), str(image_path)
 
 
+@dataclass
+class RenderCandidate:
+    """Checked render of the output handler iteration, score is the mean score of automatic checkers.
+
+    Renders without automatic checkers and renders rejected by a human checker are not candidates.
+    """
+
+    iteration: int
+    html: str
+    image: str | bytes
+    score: float
+    remarks: Optional[str] = None
+    layout: Optional[LayoutReport] = field(default=None, repr=False)
+
+
 class HtmlRenderOutputHandler(MotleyOutputHandler):
 
     def __init__(
@@ -152,17 +519,66 @@ class HtmlRenderOutputHandler(MotleyOutputHandler):
         slogan: str = None,
         max_iterations: int = 5,
         viewer: BaseViewer = None,
+        check_profile: str | ScreenshotProfile | None = None,
+        validate_html: bool = True,
+        reuse_threshold: float | None = 0.001,
+        max_checker_workers: int = 4,
+        return_best: bool = True,
+        num_variants: int = 1,
+        allow_patches: bool = True,
         *args,
         **kwargs
     ):
         super().__init__(max_iterations=max_iterations)
         self.renderer = BannerHtmlRenderer(*args, **kwargs)
+        # broken html code is returned to the agent before rendering
+        if validate_html:
+            self.validator = HtmlStaticValidator(slogan, self.renderer.window_size, self.renderer.base_dir)
+        else:
+            self.validator = None
         self.checkers = checkers or []
-        self.slogan = (slogan,)
+        # checkers get a cheap screenshot, the accepted html code is rendered again with the final profile
+        self.check_profile = check_profile
+        self.slogan = slogan
         self.viewer = viewer
         self.iteration = 0
+        # the last checked html code and slogan geometry, checkers with html and layout attributes receive them
+        self.html: str | None = None
+        self.layout: LayoutReport | None = None
+        # automatic checkers verdicts are reused if the share of changed pixels does not exceed the threshold
+        self.reuse_threshold = reuse_threshold
+        self.__last_thumbnail: np.ndarray | None = None
+        self.__last_verdicts: Dict[int, Tuple[str | None, float]] = {}
+        self.last_score: float | None = None
+        # automatic checkers run at the same time, human checkers run after them one by one
+        self.max_checker_workers = max_checker_workers
+        self.__checkers_executor: ThreadPoolExecutor | None = None
+        # checked renders ranked by score, the best one is returned when the iterations are over
+        self.return_best = return_best
+        self.candidates: List[RenderCandidate] = []
+        # the agent can return several html documents at once, they are rendered together and the best is kept
+        self.num_variants = num_variants
+        # remarks can be fixed with a css or attribute patch of the last html code
+        self.allow_patches = allow_patches
+        self.__patch_html: str | None = None
+
+    @property
+    def best_candidate(self) -> RenderCandidate | None:
+        return self.candidates[0] if self.candidates else None
 
     def handle_output(self, output: str):
+        with self.renderer.stats.timer("handle_output"):
+            try:
+                return self.__handle_output(output)
+            except InvalidOutput as e:
+                # the agent raises OutputHandlerMaxIterationsExceeded after this iteration
+                if self.return_best and self.iteration > self.max_iterations and self.candidates:
+                    return self.__return_best_candidate()
+                if self.allow_patches and self.__patch_html is not None:
+                    raise InvalidOutput("{}\n\n{}".format(e, PATCH_HINT)) from e
+                raise
+
+    def __handle_output(self, output: str):
         # check html tags
         self.iteration += 1
         view_data = {
@@ -171,6 +587,9 @@ class HtmlRenderOutputHandler(MotleyOutputHandler):
         }
         self.streamlit_view(StreamLitItemView(view_data))
 
+        if self.allow_patches and is_html_patch(output):
+            output = self.apply_patch(output)
+
         checked_tags = ("html", "head")
         is_html = False
         for tag in checked_tags:
@@ -185,19 +604,326 @@ class HtmlRenderOutputHandler(MotleyOutputHandler):
             self.streamlit_view(StreamLitItemView(view_data))
             raise InvalidOutput(msg)
 
+        if self.num_variants > 1:
+            htmls = split_html_documents(output)
+            if len(htmls) > 1:
+                return self.__handle_variants(htmls)
+
+        self.__patch_html = self.renderer.prepare_html(output)
+        problems = self.validate_html(output)
+        if problems:
+            msg = "Html code problems:\n{}".format("\n".join("    {}".format(p) for p in problems))
+            view_data = {"text": ("Invalid output: {}".format(msg),)}
+            self.streamlit_view(StreamLitItemView(view_data))
+            raise InvalidOutput(msg)
+
         self.streamlit_view(SpinnerStreamLitItemView("Rendering image ..."))
 
+        html = output
+        self.html = self.renderer.prepare_html(html)
         try:
-            output = self.renderer.render_image(output)
+            with self.renderer.stats.timer("check_render"):
+                output = self.render_checked_image(html)
         except Exception as e:
             view_data = {"error": ("Render image error: {}".format(str(e)),)}
             self.streamlit_view(StreamLitItemView(view_data))
             return {"checked_output": "Render image error"}
 
+        try:
+            self.run_checkers(output)
+        except InvalidOutput as e:
+            self.__add_candidate(html, output, self.last_score, str(e))
+            raise
+        except ReviewTimeoutException as e:
+            self.__add_candidate(html, output, self.last_score)
+            return self.__on_review_timeout(e, html, output)
+        self.__add_candidate(html, output, self.last_score)
+
+        return {"checked_output": self.finalize_output(html, output)}
+
+    def __handle_variants(self, htmls: List[str]) -> dict:
+        """Renders the html variants together, checks them and keeps the best one"""
+        problems = {}
+        valid_htmls = []
+        for i, html in enumerate(htmls):
+            html_problems = self.validate_html(html)
+            if html_problems:
+                problems[i] = html_problems
+            else:
+                valid_htmls.append((i, html))
+
+        if not valid_htmls:
+            msg = "Html code problems of all {} variants:\n{}".format(
+                len(htmls),
+                "\n".join("    variant {}: {}".format(i + 1, "; ".join(p)) for i, p in problems.items()),
+            )
+            self.streamlit_view(StreamLitItemView({"text": ("Invalid output: {}".format(msg),)}))
+            raise InvalidOutput(msg)
+
+        self.streamlit_view(SpinnerStreamLitItemView("Rendering {} variants ...".format(len(valid_htmls))))
+        with self.renderer.stats.timer("check_render"):
+            renders = self.render_checked_images([html for _, html in valid_htmls])
+
+        best = None
+        for (i, html), render in zip(valid_htmls, renders):
+            if isinstance(render, BaseException):
+                logger.warning("Failed to render html variant {}: {}".format(i + 1, render))
+                continue
+
+            image, self.layout = render
+            self.html = self.renderer.prepare_html(html)
+            verdicts = self.run_automatic_checkers(image)
+            remarks = "\n\n".join(verdicts[j][0] for j in sorted(verdicts) if verdicts[j][0] is not None)
+            self.__add_candidate(html, image, self.last_score, remarks or None)
+
+            variant = (bool(remarks), -(self.last_score or 0.0), i, html, image, self.layout, remarks)
+            if best is None or variant[:2] < best[:2]:
+                best = variant
+
+        if best is None:
+            view_data = {"error": ("Render image error of all html variants",)}
+            self.streamlit_view(StreamLitItemView(view_data))
+            return {"checked_output": "Render image error"}
+
+        _, score, i, html, image, self.layout, remarks = best
+        self.html = self.renderer.prepare_html(html)
+        self.__patch_html = self.html
+        view_data = {"text": ("Variant {} of {} is selected, score {:.2f}".format(i + 1, len(htmls), -score),)}
+        self.streamlit_view(StreamLitItemView(view_data))
+        if remarks:
+            raise InvalidOutput(
+                "The best of {} html variants is variant {}, its remarks:\n{}".format(len(htmls), i + 1, remarks)
+            )
+
+        try:
+            self.run_human_checkers(image)
+        except ReviewTimeoutException as e:
+            return self.__on_review_timeout(e, html, image)
+        return {"checked_output": self.finalize_output(html, image)}
+
+    def __on_review_timeout(self, e: ReviewTimeoutException, html: str, image: str | bytes) -> dict:
+        # the review tab is abandoned, checkers are not needed whatever the policy is
+        self.release()
+        if e.policy == REVIEW_TIMEOUT_BEST:
+            if self.candidates:
+                return self.__return_best_candidate("Human review is not received")
+            logger.warning("No scored renders to choose from, the generation is stopped")
+        if e.policy == REVIEW_TIMEOUT_APPROVE:
+            return {"checked_output": self.finalize_output(html, image)}
+        raise e
+
+    def apply_patch(self, patch_text: str) -> str:
+        """Applies the patch of the agent output to the last html code
+
+        Args:
+            patch_text (str): agent output with the <patch> block
+
+        Returns:
+            str: patched html code
+        """
+        if self.__patch_html is None:
+            msg = "There is no html code to patch yet, return the complete html code"
+        else:
+            try:
+                html = apply_html_patch(self.__patch_html, parse_html_patch(patch_text))
+            except ValueError as e:
+                msg = "Html patch error: {}".format(e)
+            else:
+                logger.info("Html patch is applied to the last html code")
+                self.streamlit_view(StreamLitItemView({"text": ("Patched html code",), "code": (html,)}))
+                return html
+
+        self.streamlit_view(StreamLitItemView({"text": ("Invalid output: {}".format(msg),)}))
+        raise InvalidOutput(msg)
+
+    def validate_html(self, html: str) -> List[str]:
+        """Returns problems of the html code found without rendering"""
+        if self.validator is None:
+            return []
+        with self.renderer.stats.timer("validate"):
+            return self.validator.validate(self.renderer.prepare_html(html))
+
+    def render_checked_images(self, htmls: List[str]) -> List[Tuple[str | bytes, LayoutReport | None] | Exception]:
+        """Renders the images for checkers at once, the slogan layouts are measured when the slogan is set"""
+        profile = self.check_profile
+        renders = self.renderer.render_images(
+            htmls,
+            return_exceptions=True,
+            profile=profile,
+            slogan=self.slogan or None,
+            save_to_disk=False if profile else None,
+        )
+        if self.slogan:
+            return renders
+        return [render if isinstance(render, BaseException) else (render, None) for render in renders]
+
+    def finalize_output(self, html: str, image: str | bytes) -> str:
+        """Returns path of the accepted image rendered with the final profile"""
+        if self.check_profile:
+            with self.renderer.stats.timer("final_render"):
+                image = self.renderer.render_image(html)
+
+        # in memory renders are written to disk only when accepted
+        if isinstance(image, bytes):
+            image = self.renderer.save_image(image)
+        return image
+
+    def __add_candidate(self, html: str, image: str | bytes, score: float | None, remarks: str | None = None):
+        if score is None:
+            return
+        candidate = RenderCandidate(self.iteration, html, image, score, remarks, self.layout)
+        self.candidates.append(candidate)
+        # later iterations win ties, they take more remarks into account
+        self.candidates.sort(key=lambda c: (c.score, c.iteration), reverse=True)
+
+    def __return_best_candidate(self, reason: str = "Iterations are over") -> dict:
+        best = self.best_candidate
+        logger.info(
+            "{}, return the best render of iteration {} with score {:.2f}".format(reason, best.iteration, best.score)
+        )
+        view_data = {
+            "text": (
+                "{}, the best render of iteration {} is returned (score {:.2f})".format(
+                    reason, best.iteration, best.score
+                ),
+            )
+        }
+        self.streamlit_view(StreamLitItemView(view_data))
+        return {"checked_output": self.finalize_output(best.html, best.image)}
+
+    def run_checkers(self, image: str | bytes):
+        """Runs the checkers, automatic checkers run concurrently and their remarks are combined.
+
+        Verdicts of automatic image-only checkers are reused for an almost unchanged render,
+        human checkers run last and only if all automatic checkers accepted the image.
+        """
+        verdicts = self.run_automatic_checkers(image)
+        remarks = [verdicts[i][0] for i in sorted(verdicts) if verdicts[i][0] is not None]
+        if remarks:
+            raise InvalidOutput("\n\n".join(remarks))
+
+        self.run_human_checkers(image)
+
+    def run_automatic_checkers(self, image: str | bytes) -> Dict[int, Tuple[str | None, float]]:
+        """Runs automatic checkers concurrently and sets last_score to their mean score
+
+        Returns:
+            dict: remarks (None if accepted) and score by the checker index
+        """
+        thumbnail = image_thumbnail(image) if self.reuse_threshold is not None else None
+        is_unchanged = (
+            thumbnail is not None
+            and self.__last_thumbnail is not None
+            and thumbnails_difference(thumbnail, self.__last_thumbnail) <= self.reuse_threshold
+        )
+        last_verdicts = self.__last_verdicts if is_unchanged else {}
+        verdicts = {}
+        self.last_score = None
+
+        try:
+            auto_checkers = []
+            for i, checker in enumerate(self.checkers):
+                if checker.is_human:
+                    continue
+                if i in last_verdicts and checker.reuses_verdict:
+                    logger.info("Render is not changed, reuse {} verdict".format(checker.__class__.__name__))
+                    verdicts[i] = last_verdicts[i]
+                    continue
+                self.__inject_check_data(checker)
+                checker.last_score = None
+                auto_checkers.append((i, checker))
+
+            if len(auto_checkers) > 1:
+                executor = self.__get_checkers_executor()
+                futures = [(i, executor.submit(self.__run_checker, checker, image)) for i, checker in auto_checkers]
+                results = [(i, future.result()) for i, future in futures]
+            else:
+                results = [(i, self.__run_checker(checker, image)) for i, checker in auto_checkers]
+
+            error = None
+            for i, result in results:
+                if isinstance(result, InvalidOutput) or result is None:
+                    remarks = str(result) if result is not None else None
+                    score = self.checkers[i].last_score
+                    if score is None:
+                        score = 0.0 if remarks else 1.0
+                    verdicts[i] = (remarks, score)
+                elif error is None:
+                    error = result
+            if error is not None:
+                raise error
+        finally:
+            self.__last_thumbnail = thumbnail
+            self.__last_verdicts = verdicts
+
+        # without automatic checkers the render is not scored and is not a candidate
+        if verdicts:
+            self.last_score = sum(score for _, score in verdicts.values()) / len(verdicts)
+        return verdicts
+
+    def run_human_checkers(self, image: str | bytes):
         for checker in self.checkers:
-            checker.check(output)
+            if not checker.is_human:
+                continue
+            self.__inject_check_data(checker)
+            result = self.__run_checker(checker, image)
+            if result is not None:
+                if isinstance(result, InvalidOutput):
+                    # the human rejection outweighs the automatic score
+                    self.last_score = None
+                    self.candidates = [c for c in self.candidates if c.image is not image]
+                raise result
+
+    def __inject_check_data(self, checker: BaseChecker):
+        if hasattr(checker, "html"):
+            checker.html = self.html
+        if hasattr(checker, "slogan") and self.slogan:
+            checker.slogan = self.slogan
+        if hasattr(checker, "layout"):
+            checker.layout = self.layout
+
+    def __run_checker(self, checker: BaseChecker, image: str | bytes) -> Exception | None:
+        try:
+            with self.renderer.stats.timer("checker.{}".format(checker.__class__.__name__)):
+                checker.check(image)
+        except Exception as e:
+            return e
+        return None
 
-        return {"checked_output": output}
+    def release(self):
+        """Stops the checkers threads and releases models loaded by the checkers.
+
+        The browser pool is shared by the process and stays open, its pages are released after every render.
+        """
+        if self.__checkers_executor is not None:
+            self.__checkers_executor.shutdown(wait=False, cancel_futures=True)
+            self.__checkers_executor = None
+        for checker in self.checkers:
+            checker.release()
+        self.__last_thumbnail = None
+        self.__last_verdicts = {}
+
+    def __get_checkers_executor(self) -> ThreadPoolExecutor:
+        if self.__checkers_executor is None:
+            self.__checkers_executor = ThreadPoolExecutor(
+                max_workers=self.max_checker_workers, thread_name_prefix="checkers"
+            )
+        return self.__checkers_executor
+
+    def render_checked_image(self, html: str) -> str | bytes:
+        """Renders the image for checkers, the slogan layout is measured on the same page load"""
+        profile = self.check_profile
+        save_to_disk = False if profile else None
+        if self.slogan:
+            output, self.layout = self.renderer.render_image_with_layout(
+                html, self.slogan, profile=profile, save_to_disk=save_to_disk
+            )
+            return output
+
+        self.layout = None
+        if profile:
+            return self.renderer.render_image_bytes(html, profile=profile)
+        return self.renderer.render_image(html)
 
     def streamlit_view(self, item_view: Union[StreamLitItemView, SpinnerStreamLitItemView]):
         if isinstance(self.viewer, StreamLitItemQueueViewer):
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Tuple
+from urllib.parse import unquote, urlsplit
+
+from disk_cache import DiskCache
+
+
+ASSET_REFERENCE_PATTERNS = (
+    re.compile(r"""\b(?:src|href)\s*=\s*["']([^"']+)["']""", re.IGNORECASE),
+    re.compile(r"""url\(\s*["']?([^"')]+)["']?\s*\)""", re.IGNORECASE),
+)
+REMOTE_URL_SCHEMES = ("http", "https", "data", "blob", "about", "javascript", "mailto")
+
+
+def normalize_html(html: str) -> str:
+    """Collapses whitespace runs, they do not change the rendering of the banner html code"""
+    return re.sub(r"\s+", " ", html).strip()
+
+
+def find_local_assets(html: str, base_dir: str | Path | None = None) -> list[Path]:
+    """Returns existing local files referenced by src, href and css url() of the html code
+
+    Args:
+        html (str): html code
+        base_dir (str | Path): directory for resolving relative references
+
+    Returns:
+        list: sorted unique asset paths
+    """
+    assets = set()
+    for pattern in ASSET_REFERENCE_PATTERNS:
+        for reference in pattern.findall(html):
+            path = resolve_local_reference(reference, base_dir)
+            if path is not None and path.is_file():
+                assets.add(path)
+    return sorted(assets)
+
+
+def resolve_local_reference(reference: str, base_dir: str | Path | None = None) -> Path | None:
+    """Converts a src/href/url() reference of the html code to a local path
+
+    Returns:
+        Path | None: path, None for remote and inline references
+    """
+    reference = reference.strip()
+    if not reference or reference.startswith("#"):
+        return None
+
+    split_reference = urlsplit(reference)
+    scheme = split_reference.scheme.lower()
+    if scheme == "file":
+        path = unquote(split_reference.path)
+        # file:///C:/dir on windows
+        if re.match(r"^/[a-zA-Z]:", path):
+            path = path[1:]
+        return Path(path)
+
+    # one letter scheme is a windows drive
+    if len(scheme) > 1 or scheme in REMOTE_URL_SCHEMES:
+        return None
+
+    path = Path(unquote(reference.split("?")[0].split("#")[0]))
+    if not path.is_absolute() and base_dir is not None:
+        path = Path(base_dir) / path
+    return path
+
+
+class RenderCache(DiskCache):
+    """Content addressed disk cache of rendered banners.
+
+    The key is a hash of the normalized html code, the viewport, render options and
+    contents of the referenced local assets. Entries are evicted in LRU order
+    when the cache size exceeds max_size bytes.
+    """
+
+    name = "Render cache"
+
+    def __init__(self, cache_dir: str, max_size: int = 512 * 1024 * 1024, image_ext: str = "png"):
+        self.image_ext = image_ext
+        self.__lock = Lock()
+        self.__assets_hashes: Dict[Path, Tuple[int, int, str]] = {}
+        super().__init__(cache_dir, max_size, image_ext)
+
+    def build_key(
+        self,
+        html: str,
+        view_size: dict | None = None,
+        base_dir: str | Path | None = None,
+        **options,
+    ) -> str:
+        """Builds cache key of the render
+
+        Args:
+            html (str): html code
+            view_size (dict): viewport width and height
+            base_dir (str | Path): directory for resolving relative asset references
+            **options: other render options changing the image
+
+        Returns:
+            str: hex digest
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(normalize_html(html).encode("utf-8"))
+        key_hash.update(json.dumps({"view_size": view_size, **options}, sort_keys=True, default=str).encode())
+        for asset_path in find_local_assets(html, base_dir):
+            key_hash.update(str(asset_path).encode("utf-8"))
+            key_hash.update(self.__hash_asset(asset_path).encode())
+        return key_hash.hexdigest()
+
+    def get_meta(self, key: str) -> dict | None:
+        """Returns metadata saved with the cached image"""
+        try:
+            with open(self.__meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, image: bytes, meta: dict | None = None):
+        """Saves image bytes with optional json metadata and evicts least recently used entries"""
+        if meta is not None:
+            with open(self.__meta_path(key), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        super().put(key, image)
+
+    def entry_files(self, key: str) -> List[Path]:
+        return [self.entry_path(key), self.__meta_path(key)]
+
+    def __meta_path(self, key: str) -> Path:
+        return self.cache_dir / "{}.json".format(key)
+
+    def __hash_asset(self, path: Path) -> str:
+        stat = path.stat()
+        with self.__lock:
+            cached = self.__assets_hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        asset_hash = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                asset_hash.update(chunk)
+        digest = asset_hash.hexdigest()
+
+        with self.__lock:
+            self.__assets_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
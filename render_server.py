@@ -0,0 +1,301 @@
+import atexit
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from threading import Thread, Lock
+from typing import Any, Dict, List
+
+from browser_pool import BrowserPool, RenderRequest, RenderResult
+from exceptions import RenderServerException
+
+from motleycrew.common import logger
+
+
+RENDER_SERVER_ENV = "BANNERS_RENDER_SERVER"
+RENDER_SERVER_AUTHKEY_ENV = "BANNERS_RENDER_SERVER_AUTHKEY"
+
+if sys.platform == "win32":
+    DEFAULT_RENDER_SERVER_ADDRESS = r"\\.\pipe\banners_render_server"
+else:
+    DEFAULT_RENDER_SERVER_ADDRESS = os.path.join(tempfile.gettempdir(), "banners_render_server.sock")
+
+# servers started by this process share the random key, a standalone server needs the key from the environment
+DEFAULT_AUTHKEY = os.environ.get(RENDER_SERVER_AUTHKEY_ENV, "").encode() or os.urandom(32)
+
+
+class RenderServer:
+    """Render service owning one browser pool for all clients.
+
+    Listens on a unix socket (a named pipe on windows), every client connection is
+    served in its own thread and every render request has its own timeout.
+    """
+
+    def __init__(
+        self,
+        address: str = DEFAULT_RENDER_SERVER_ADDRESS,
+        authkey: bytes = DEFAULT_AUTHKEY,
+        headless: bool = True,
+        max_pages: int = 4,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.browser_pool = BrowserPool(headless=headless, max_pages=max_pages)
+        self.__listener = None
+        self.__is_stopped = False
+
+    def serve_forever(self):
+        if sys.platform != "win32" and os.path.exists(self.address):
+            self.__remove_stale_socket()
+
+        self.__listener = Listener(self.address, authkey=self.authkey)
+        if sys.platform != "win32":
+            os.chmod(self.address, 0o600)
+        logger.info("Render server is listening on {}".format(self.address))
+
+        try:
+            while not self.__is_stopped:
+                try:
+                    conn = self.__listener.accept()
+                except Exception as e:
+                    if self.__is_stopped:
+                        break
+                    logger.warning("Render server failed to accept connection: {}".format(e))
+                    continue
+                Thread(target=self.__serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.__listener.close()
+            self.browser_pool.close()
+            logger.info("Render server stopped")
+
+    def __remove_stale_socket(self):
+        try:
+            # no authkey, a live server with any key accepts the connection
+            Client(self.address).close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            # socket file left by a crashed server
+            os.remove(self.address)
+            return
+        raise RenderServerException("Render server is already running at {}".format(self.address))
+
+    def stop(self):
+        if self.__is_stopped:
+            return
+        self.__is_stopped = True
+        # closing the listener does not interrupt a blocked accept, a connection does
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except Exception:
+            pass
+
+    def __serve_connection(self, conn: Connection):
+        with conn:
+            while not self.__is_stopped:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    break
+
+                command = message.get("command")
+                if command == "ping":
+                    conn.send(("ok", None))
+                elif command == "render":
+                    conn.send(self.__render(message))
+                elif command == "shutdown":
+                    conn.send(("ok", None))
+                    self.stop()
+                else:
+                    conn.send(("error", "Unknown command {}".format(command)))
+
+    def __render(self, message: Dict[str, Any]) -> tuple:
+        try:
+            future = self.browser_pool.submit_render_requests(
+                message["requests"],
+                concurrency=message.get("concurrency"),
+                timeout=message.get("timeout"),
+                return_exceptions=True,
+            )
+            results = future.result()
+        except Exception as e:
+            return "error", "{}: {}".format(e.__class__.__name__, e)
+
+        # playwright exceptions are not always picklable
+        results = [
+            RenderServerException("{}: {}".format(r.__class__.__name__, r)) if isinstance(r, BaseException) else r
+            for r in results
+        ]
+        return "ok", results
+
+
+class RenderClient:
+    """Thin client of the RenderServer with the BrowserPool.submit_render_requests interface"""
+
+    def __init__(
+        self,
+        address: str = DEFAULT_RENDER_SERVER_ADDRESS,
+        authkey: bytes = DEFAULT_AUTHKEY,
+        max_workers: int = 8,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render_client")
+
+    def submit_render_requests(
+        self,
+        requests: List[RenderRequest],
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        return_exceptions: bool = False,
+    ) -> Future:
+        """Sends the render requests to the server in a background thread
+
+        Returns:
+            Future: concurrent future with the list of render results in the requests order
+        """
+        return self.__executor.submit(self.render, requests, concurrency, timeout, return_exceptions)
+
+    def render(
+        self,
+        requests: List[RenderRequest],
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        return_exceptions: bool = False,
+    ) -> List[RenderResult | Exception]:
+        """Renders the requests on the server, timeout is applied to every request"""
+        message = {"command": "render", "requests": requests, "concurrency": concurrency, "timeout": timeout}
+        results = self.__send(message)
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def ping(self) -> bool:
+        """Returns False if the server does not answer
+
+        Raises:
+            RenderServerException: the server answers, but uses a different key
+        """
+        try:
+            self.__send({"command": "ping"})
+        except multiprocessing.AuthenticationError:
+            raise RenderServerException(
+                "Render server at {} uses a different {}".format(self.address, RENDER_SERVER_AUTHKEY_ENV)
+            )
+        except (OSError, EOFError, RenderServerException):
+            return False
+        return True
+
+    def shutdown(self):
+        self.__send({"command": "shutdown"})
+
+    def __send(self, message: Dict[str, Any]) -> Any:
+        with Client(self.address, authkey=self.authkey) as conn:
+            conn.send(message)
+            status, result = conn.recv()
+
+        if status != "ok":
+            raise RenderServerException(result)
+        return result
+
+
+def run_render_server(
+    address: str = DEFAULT_RENDER_SERVER_ADDRESS,
+    authkey: bytes = DEFAULT_AUTHKEY,
+    headless: bool = True,
+    max_pages: int = 4,
+):
+    RenderServer(address, authkey, headless=headless, max_pages=max_pages).serve_forever()
+
+
+def start_render_server(
+    address: str = DEFAULT_RENDER_SERVER_ADDRESS,
+    authkey: bytes = DEFAULT_AUTHKEY,
+    headless: bool = True,
+    max_pages: int = 4,
+    start_timeout: float = 30,
+) -> multiprocessing.Process:
+    """Starts the render server in a separate process and waits until it answers"""
+    ctx = multiprocessing.get_context("spawn")
+    process = ctx.Process(
+        target=run_render_server,
+        args=(address, authkey, headless, max_pages),
+        name="render_server",
+        daemon=True,
+    )
+    process.start()
+
+    client = RenderClient(address, authkey, max_workers=1)
+    deadline = time.monotonic() + start_timeout
+    while not client.ping():
+        if not process.is_alive():
+            raise RenderServerException("Render server process exited with code {}".format(process.exitcode))
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise RenderServerException("Render server did not start in {} s".format(start_timeout))
+        time.sleep(0.1)
+
+    def stop_process():
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+        process.join(10)
+
+    # the server closes its browser before multiprocessing terminates the daemon process
+    atexit.register(stop_process)
+    return process
+
+
+_clients: Dict[str, RenderClient] = {}
+_clients_lock = Lock()
+
+
+def get_render_client(
+    address: str | None = None,
+    authkey: bytes = DEFAULT_AUTHKEY,
+    start_server: bool = True,
+    **server_kwargs,
+) -> RenderClient:
+    """Returns the client shared by all sessions of the process, starts the server if it is not running
+
+    Args:
+        address (str): server address, DEFAULT_RENDER_SERVER_ADDRESS by default
+        authkey (bytes): connection key
+        start_server (bool): start the server process if it does not answer
+        **server_kwargs: start_render_server arguments
+
+    Returns:
+        RenderClient: client
+    """
+    address = address or DEFAULT_RENDER_SERVER_ADDRESS
+    with _clients_lock:
+        client = _clients.get(address)
+        if client is None:
+            client = RenderClient(address, authkey)
+            _clients[address] = client
+
+        if start_server and not client.ping():
+            start_render_server(address, authkey, **server_kwargs)
+    return client
+
+
+def find_env_render_client() -> RenderClient | None:
+    """Returns the shared client if the BANNERS_RENDER_SERVER environment variable is set
+
+    The variable is "1" for the default server address or the server address itself.
+    """
+    value = os.environ.get(RENDER_SERVER_ENV, "").strip()
+    if not value or value.lower() in ("0", "false", "no"):
+        return None
+
+    address = None if value.lower() in ("1", "true", "yes") else value
+    return get_render_client(address)
+
+
+if __name__ == "__main__":
+    run_render_server()
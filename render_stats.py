@@ -0,0 +1,102 @@
+import json
+import math
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Deque, Dict, Iterator, List
+
+from motleycrew.common import logger
+
+
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest rank percentile of the values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+class RenderStats:
+    """In-process timings of the html render path stages.
+
+    Every stage keeps the last max_samples durations in seconds. When jsonl_path is set
+    every record is also appended to the JSON lines file for analysis after a load test.
+    """
+
+    def __init__(self, jsonl_path: str | None = None, max_samples: int = 10000):
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.max_samples = max_samples
+        self.__lock = Lock()
+        self.__samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.max_samples))
+
+    def record(self, stage: str, seconds: float, **tags):
+        """Adds the stage duration, tags are written only to the JSON lines file"""
+        with self.__lock:
+            self.__samples[stage].append(seconds)
+            if self.jsonl_path is None:
+                return
+            record = {"time": time.time(), "stage": stage, "seconds": seconds, **tags}
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                logger.warning("Failed to write render stats to {}: {}".format(self.jsonl_path, e))
+
+    def record_many(self, timings: Dict[str, float], **tags):
+        for stage, seconds in timings.items():
+            self.record(stage, seconds, **tags)
+
+    @contextmanager
+    def timer(self, stage: str, **tags) -> Iterator[None]:
+        """Records the duration of the with block, failed blocks are recorded too"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **tags)
+
+    def summary(self, percentiles: tuple = DEFAULT_PERCENTILES) -> Dict[str, dict]:
+        """Returns count, mean, max and percentiles of every stage in seconds"""
+        with self.__lock:
+            samples = {stage: list(values) for stage, values in self.__samples.items()}
+
+        summary = {}
+        for stage, values in sorted(samples.items()):
+            stage_summary = {
+                "count": len(values),
+                "mean": sum(values) / len(values) if values else 0.0,
+                "max": max(values, default=0.0),
+            }
+            for q in percentiles:
+                stage_summary["p{}".format(q)] = percentile(values, q)
+            summary[stage] = stage_summary
+        return summary
+
+    def reset(self):
+        with self.__lock:
+            self.__samples.clear()
+
+
+def add_timing(timings: Dict[str, float] | None, stage: str, start: float):
+    """Adds the time elapsed from start to the stage of the timings dict"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+_render_stats = RenderStats()
+
+
+def get_render_stats() -> RenderStats:
+    """Returns the stats shared by renderers and browser pools of the process"""
+    return _render_stats
+
+
+def set_render_stats_file(jsonl_path: str | None):
+    """Starts or stops writing the shared stats to the JSON lines file"""
+    _render_stats.jsonl_path = Path(jsonl_path) if jsonl_path else None
@@ -0,0 +1,123 @@
+from typing import Dict, List, Tuple
+
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.agents import AgentAction
+from langchain_core.messages import AIMessage
+
+from html_patch import PATCH_HINT
+
+
+class ScratchpadCompactor:
+    """Intermediate steps processor of the ReAct agent which compacts stale steps.
+
+    Html code of the older output handler calls is replaced with a short note, except
+    the latest call and the latest complete html document, which is the base of patches.
+    Long outputs of other tools called before the latest output handler call keep only
+    their first lines. Remarks of the output handler are kept verbatim.
+    """
+
+    def __init__(
+        self,
+        output_handler_name: str = "output_handler",
+        min_compact_length: int = 500,
+        max_observation_lines: int = 8,
+    ):
+        self.output_handler_name = output_handler_name
+        # shorter outputs, e.g. patches, are cheaper to keep than to summarize
+        self.min_compact_length = min_compact_length
+        self.max_observation_lines = max_observation_lines
+
+    def __call__(self, intermediate_steps: List[Tuple[AgentAction, str]]) -> List[Tuple[AgentAction, str]]:
+        handler_steps = [i for i, (action, _) in enumerate(intermediate_steps) if self.__is_handler_step(action)]
+        if not handler_steps:
+            return intermediate_steps
+
+        last_handler_step = handler_steps[-1]
+        kept_steps = {last_handler_step}
+        for i in reversed(handler_steps):
+            if "<html" in self.__get_output(intermediate_steps[i][0]).lower():
+                kept_steps.add(i)
+                break
+
+        summaries = {}
+        for n, i in enumerate(handler_steps, 1):
+            output = self.__get_output(intermediate_steps[i][0])
+            if i not in kept_steps and len(output) >= self.min_compact_length:
+                summaries[i] = self.summarize_output(output, n)
+
+        # the html code is sent to the llm as arguments of the tool call in the agent message
+        call_summaries = {
+            intermediate_steps[i][0].tool_call_id: summary
+            for i, summary in summaries.items()
+            if isinstance(intermediate_steps[i][0], ToolAgentAction)
+        }
+        compacted_messages: Dict[int, AIMessage] = {}
+
+        steps = []
+        for i, (action, observation) in enumerate(intermediate_steps):
+            if i in summaries:
+                action = self.__compact_handler_action(action, summaries[i])
+            if call_summaries and isinstance(action, ToolAgentAction):
+                action = self.__compact_message_log(action, call_summaries, compacted_messages)
+            if i in handler_steps:
+                if i != last_handler_step and isinstance(observation, str):
+                    observation = observation.replace("\n\n{}".format(PATCH_HINT), "")
+            elif i < last_handler_step and isinstance(observation, str):
+                observation = self.compact_observation(observation)
+            steps.append((action, observation))
+        return steps
+
+    def compact_observation(self, observation: str) -> str:
+        lines = observation.splitlines()
+        if len(lines) <= self.max_observation_lines:
+            return observation
+        omitted = len(lines) - self.max_observation_lines
+        return "\n".join(lines[: self.max_observation_lines] + ["... {} more lines omitted".format(omitted)])
+
+    def summarize_output(self, output: str, attempt: int) -> str:
+        return "[html attempt {} of {} characters is omitted, its remarks are in the tool result]".format(
+            attempt, len(output)
+        )
+
+    def __is_handler_step(self, action: AgentAction) -> bool:
+        return action.tool == self.output_handler_name
+
+    @staticmethod
+    def __get_output(action: AgentAction) -> str:
+        if isinstance(action.tool_input, dict):
+            return "\n".join(str(v) for v in action.tool_input.values())
+        return str(action.tool_input)
+
+    @staticmethod
+    def __compact_handler_action(action: AgentAction, summary: str) -> AgentAction:
+        if isinstance(action.tool_input, dict):
+            tool_input = {k: summary if isinstance(v, str) else v for k, v in action.tool_input.items()}
+        else:
+            tool_input = summary
+        return action.copy(update={"tool_input": tool_input, "log": summary})
+
+    def __compact_message_log(
+        self, action: ToolAgentAction, call_summaries: Dict[str, str], compacted_messages: Dict[int, AIMessage]
+    ) -> ToolAgentAction:
+        # parallel tool calls share the message, it is compacted once to stay deduplicated
+        message_log = []
+        for message in action.message_log:
+            if isinstance(message, AIMessage) and any(c["id"] in call_summaries for c in message.tool_calls):
+                if id(message) not in compacted_messages:
+                    compacted_messages[id(message)] = self.__compact_message(message, call_summaries)
+                message = compacted_messages[id(message)]
+            message_log.append(message)
+        return action.copy(update={"message_log": message_log})
+
+    @staticmethod
+    def __compact_message(message: AIMessage, call_summaries: Dict[str, str]) -> AIMessage:
+        tool_calls = []
+        for tool_call in message.tool_calls:
+            summary = call_summaries.get(tool_call["id"])
+            if summary is not None:
+                args = {k: summary if isinstance(v, str) else v for k, v in tool_call["args"].items()}
+                tool_call = {**tool_call, "args": args}
+            tool_calls.append(tool_call)
+
+        additional_kwargs = {k: v for k, v in message.additional_kwargs.items() if k != "tool_calls"}
+        return message.copy(update={"tool_calls": tool_calls, "additional_kwargs": additional_kwargs})
@@ -10,6 +10,7 @@ from motleycrew.tools import MotleyTool
 
 from .mixins import ViewDecoratorToolMixin
 from viewers import StreamLitItemViewer, BaseViewer
+from utils import guess_image_format
 
 
 class GptImageProcessor:
@@ -25,17 +26,23 @@ class GptImageProcessor:
         self.max_tokens = max_tokens
 
     @staticmethod
-    def encode_image(image_path):
+    def encode_image(image_path: str | bytes):
+        if isinstance(image_path, bytes):
+            return base64.b64encode(image_path).decode('utf-8')
+
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
-    def process_image(self, image_path: str, prompt: str = None) -> str:
-        image_path = image_path.strip()
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(image_path)
+    def process_image(self, image_path: str | bytes, prompt: str = None) -> str:
+        if isinstance(image_path, bytes):
+            img_ext = guess_image_format(image_path)
+        else:
+            image_path = image_path.strip()
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(image_path)
 
-        _, img_ext = os.path.splitext(image_path)
-        img_ext = img_ext[1:]
+            _, img_ext = os.path.splitext(image_path)
+            img_ext = img_ext[1:]
 
         base64_image = self.encode_image(image_path)
         prompt = prompt or self.prompt
@@ -1,15 +1,14 @@
 import os
-from typing import Tuple, Any
+from typing import List, Tuple, Any
 
 import cv2
 import numpy as np
-from sklearn.cluster import KMeans
 
 from langchain.tools import Tool
 from langchain_core.pydantic_v1 import BaseModel, Field
 
 from motleycrew.tools import MotleyTool
-from utils import get_points_density
+from utils import get_points_density, dominant_colors
 from .mixins import ViewDecoratorToolMixin
 from viewers import StreamLitViewer, StreamLitItemView, BaseViewer
 
@@ -43,21 +42,24 @@ class BannerImageParser:
         image_info.append(str_slogan_mask)
 
         # find main color
-        color = self.get_color(img[img_slice[0]: img_slice[1], ...])
-        str_color = "COLOR rgb: {}".format(", ".join([str(c) for c in color]))
+        palette = self.get_palette(img[img_slice[0]: img_slice[1], ...])
+        str_color = "COLOR rgb: {}".format(", ".join([str(c) for c in palette[0][0]]))
         image_info.append(str_color)
+        str_palette = "PALETTE: {}".format(
+            ", ".join("rgb({}) {:.0%}".format(", ".join(str(c) for c in color), share) for color, share in palette)
+        )
+        image_info.append(str_palette)
         return "\n".join(image_info)
 
     def get_color(self, image: np.array) -> Tuple[int, int, int]:
+        return list(self.get_palette(image)[0][0])
 
-        reshape = image.reshape((image.shape[0] * image.shape[1], 3))
-        cluster = KMeans(n_clusters=self.num_clusters).fit(reshape)
-        labels = np.arange(0, len(np.unique(cluster.labels_)) + 1)
-        (hist, _) = np.histogram(cluster.labels_, bins=labels)
-        color_max_args = np.argmax(hist)
-        color = cluster.cluster_centers_[color_max_args]
-        color = [int(c) for c in color]
-        return color
+    def get_palette(self, image: np.array) -> List[Tuple[Tuple[int, int, int], float]]:
+        """Returns (color, share of pixels) of num_clusters colors, the main color first.
+
+        Colors are clustered on the histogram of the downsampled image instead of all its pixels.
+        """
+        return dominant_colors(image, self.num_clusters)
 
     def get_slogan_location(self, img: np.array) -> Tuple[Tuple[int, int], str]:
 
@@ -120,6 +122,6 @@ def create_render_tool(parser: BannerImageParser):
         func=parser.parse_image,
         name="image_info_tool",
         description="A tool that returns the size of the image, the location of the text (SLOGAN LOCATION) "
-                    "and the main color",
+                    "the main color and the color palette",
         args_schema=BannerImageParserToolInput,
     )
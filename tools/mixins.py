@@ -1,8 +1,15 @@
 from typing import Callable, Any
 from threading import Event
-from queue import Queue
+from queue import Empty, Queue
 from viewers import StreamLitViewer, SpinnerStreamLitItemView, StreamLitItemView, StreamLitItemFormView
-from exceptions import RunStopException
+from exceptions import (
+    RunStopException,
+    ReviewTimeoutException,
+    REVIEW_TIMEOUT_ABORT,
+    REVIEW_TIMEOUT_APPROVE,
+    REVIEW_TIMEOUT_POLICIES,
+)
+from motleycrew.common import logger
 
 
 IMAGE_GENERATION_REMARKS_WIDGET_KEY = "image_generation_remark"
@@ -79,9 +86,28 @@ class ViewDecoratorRemarksMixin(ViewDecoratorToolMixin):
 
 class ViewDecoratorImageGenerationMixin(ViewDecoratorRemarksMixin):
 
-    def __init__(self, is_text_editor: bool = False):
+    def __init__(
+        self,
+        is_text_editor: bool = False,
+        review_timeout: float | None = None,
+        timeout_policy: str = REVIEW_TIMEOUT_APPROVE,
+    ):
         self.is_text_editor = is_text_editor
         ViewDecoratorRemarksMixin.__init__(self)
+        self.set_review_timeout(review_timeout, timeout_policy)
+
+    def set_review_timeout(self, review_timeout: float | None, timeout_policy: str = REVIEW_TIMEOUT_APPROVE):
+        """Limits the wait of the user remarks, an abandoned browser tab must not pin the generator
+
+        Args:
+            review_timeout (float): seconds to wait, None waits forever
+            timeout_policy (str): approve the images or abort the generation, the best policy
+                approves them too, there is only one result to choose from
+        """
+        if timeout_policy not in REVIEW_TIMEOUT_POLICIES:
+            raise ValueError("Unknown review timeout policy {}".format(timeout_policy))
+        self.review_timeout = review_timeout
+        self.timeout_policy = timeout_policy
 
     preface_remark = (
         "It is necessary to regenerate the images taking into account the following remarks"
@@ -108,7 +134,15 @@ class ViewDecoratorImageGenerationMixin(ViewDecoratorRemarksMixin):
         )
         form_data = {"form": form_item_view}
         self.viewer.view(StreamLitItemView(form_data), to_history=False)
-        remarks = self.remark_queue.get()
+        try:
+            remarks = self.remark_queue.get(timeout=self.review_timeout)
+        except Empty:
+            msg = "Image generation review is not received in {} seconds".format(self.review_timeout)
+            logger.warning("{}, timeout policy: {}".format(msg, self.timeout_policy))
+            if self.timeout_policy == REVIEW_TIMEOUT_ABORT:
+                raise ReviewTimeoutException(msg, self.timeout_policy)
+            self.viewer.view(StreamLitItemView({"text": ("{}, the images are approved".format(msg),)}))
+            return results
         if not remarks:
             return results
 
@@ -7,7 +7,7 @@ from motleycrew.tools import MotleyTool
 from generator import BannerGeneratorWithText, BannerGenerator
 from checkers import BaseChecker
 from viewers import StreamLitItemQueueViewer, StreamLitItemView, SpinnerStreamLitItemView
-from exceptions import RunStopException, GeneratorIsRunException
+from exceptions import RunStopException, GeneratorIsRunException, ReviewTimeoutException
 from utils import clear_queue
 
 
@@ -53,18 +53,27 @@ class UiBannerGeneratorMixin():
 
         try:
             result = self.run()
+        except ReviewTimeoutException as e:
+            view_data = {"subheader": ("Generation is stopped:",), "text": (str(e),)}
+            self._render_queue.put(StreamLitItemView(view_data))
         except RunStopException as e:
             pass
         except Exception as e:
             view_data = {"subheader": ("Error:",), "code": (str(e),)}
             self._render_queue.put(StreamLitItemView(view_data))
         finally:
+            self.release_resources()
             self._render_queue.put(None)
             self._remarks_queue.put(None)
             self._is_run = False
 
         return result
 
+    def release_resources(self):
+        """Releases checkers threads and models held by the finished or abandoned generation"""
+        if hasattr(self, "html_render_output_handler"):
+            self.html_render_output_handler.release()
+
     @property
     def render_queue(self):
         return self._render_queue
@@ -12,7 +12,15 @@ import streamlit as st
 from checkers import StreamLitHumanChecker, REMARKS_WIDGET_KEY
 from tools.mixins import IMAGE_GENERATION_REMARKS_WIDGET_KEY
 from generator_with_ui import UiBannerGenerator
-from ui_utils import IMAGE_GENERATORS, init_image_generator, find_remarks, navigation_menu, stop_other_generators
+from ui_utils import (
+    IMAGE_GENERATORS,
+    UI_REVIEW_TIMEOUT,
+    UI_REVIEW_TIMEOUT_POLICY,
+    init_image_generator,
+    find_remarks,
+    navigation_menu,
+    stop_other_generators,
+)
 from viewers import StreamLitItemQueueViewer, streamlit_queue_render
 
 from motleycache.http_cache import FORCED_CACHE_BLACKLIST
@@ -110,7 +118,9 @@ def main():
             images_dir=images_dir,
             slogan=slogan,
             max_review_iterations=max_review_iterations,
-            html_render_checkers=[StreamLitHumanChecker()],
+            html_render_checkers=[
+                StreamLitHumanChecker(review_timeout=UI_REVIEW_TIMEOUT, timeout_policy=UI_REVIEW_TIMEOUT_POLICY)
+            ],
             image_generate_tool=image_generate_tool,
         )
         st.session_state[generator_key] = generator
@@ -6,6 +6,7 @@ from motleycrew.tools import MotleyTool
 from motleycache import enable_cache, disable_cache
 from motleycache.caching import check_is_caching
 
+from exceptions import REVIEW_TIMEOUT_ABORT
 from tools.dalle_image_generator_tool import DalleImageGeneratorTool
 from tools.replicate_image_generation_tool import ReplicateImageGenerationTool
 from tools.generate_post_tools.text_generation_tool import PostTextGeneratorTool
@@ -17,6 +18,10 @@ REPLICATE_GENERATOR = "Replicate"
 
 IMAGE_GENERATORS = (REPLICATE_GENERATOR, DALLE_GENERATOR)
 
+# a review not received from an abandoned browser tab stops the generation
+UI_REVIEW_TIMEOUT = 30 * 60
+UI_REVIEW_TIMEOUT_POLICY = REVIEW_TIMEOUT_ABORT
+
 
 def init_image_generator(
     generator_name: str,
@@ -55,6 +60,7 @@ def init_image_generator(
             width=image_size[0],
             height=image_size[1],
         )
+    generator.set_review_timeout(UI_REVIEW_TIMEOUT, UI_REVIEW_TIMEOUT_POLICY)
     return generator
 
 
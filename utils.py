@@ -1,3 +1,4 @@
+import io
 import os
 from queue import Queue
 from typing import List, Tuple, Union
@@ -10,8 +11,8 @@ from PIL import Image, ImageFile
 STREAMLIT_HISTORY_KEY = "view_history_steps"
 
 
-def show_image(image_path: str, q: Queue):
-    img = cv2.imread(image_path)
+def show_image(image: str | bytes, q: Queue):
+    img = cv2.imread(image) if isinstance(image, str) else decode_image(image)
     img = cv2.resize(img, (512, 512))
     window_name = "banner image"
     cv2.imshow(window_name, img)
@@ -66,9 +67,9 @@ def combining_mask_boxes(mask: np.array, kernel: tuple = (20, 20), iterations: i
 
 
 def read_image(
-    image_path: str, as_array: bool = True, to_bgr: bool = True
+    image_path: str | bytes, as_array: bool = True, to_bgr: bool = True
 ) -> Union[np.ndarray | ImageFile.ImageFile]:
-    img = Image.open(image_path)
+    img = Image.open(io.BytesIO(image_path) if isinstance(image_path, bytes) else image_path)
 
     if as_array:
         img = np.array(img)
@@ -84,6 +85,188 @@ def read_image(
     return img
 
 
+def decode_image(image: bytes) -> np.ndarray:
+    """Decodes encoded image bytes to BGR numpy array"""
+    return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def guess_image_format(image: bytes) -> str:
+    """Returns image format name by the signature of encoded image bytes"""
+    if image.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def image_thumbnail(image: str | bytes, size: int = 64) -> np.ndarray:
+    """Returns size x size BGR thumbnail of the image for comparing renders"""
+    img = cv2.imread(image, cv2.IMREAD_COLOR) if isinstance(image, str) else decode_image(image)
+    return cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def thumbnails_difference(thumbnail: np.ndarray, other: np.ndarray, pixel_threshold: int = 16) -> float:
+    """Returns the share of thumbnail pixels changed by more than pixel_threshold in any channel"""
+    if thumbnail.shape != other.shape:
+        return 1.0
+    diff = cv2.absdiff(thumbnail, other).max(axis=2)
+    return float(np.count_nonzero(diff > pixel_threshold)) / diff.size
+
+
+def relative_luminance(color: Tuple[float, float, float]) -> float:
+    """WCAG relative luminance of the RGB color with 0-255 channels"""
+    channels = []
+    for c in color:
+        c = c / 255
+        channels.append(c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4)
+    r, g, b = channels
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def contrast_ratio(color: Tuple[float, float, float], other: Tuple[float, float, float]) -> float:
+    """WCAG contrast ratio of two RGB colors, from 1 to 21"""
+    lighter, darker = sorted((relative_luminance(color), relative_luminance(other)), reverse=True)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def resize_cover(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Scales and center crops the image to (width, height) like css background-size: cover"""
+    width, height = size
+    h, w = image.shape[:2]
+    scale = max(width / w, height / h)
+    resized_size = (max(width, round(w * scale)), max(height, round(h * scale)))
+    resized = cv2.resize(image, resized_size, interpolation=cv2.INTER_AREA)
+    y = (resized.shape[0] - height) // 2
+    x = (resized.shape[1] - width) // 2
+    return resized[y: y + height, x: x + width]
+
+
+def find_clutter_points(image: np.ndarray, point_threshold: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns bool maps of Harris corners and Canny edges of the BGR image.
+
+    Corners are relative to the strongest corner of the image, so only corners near
+    edges are kept, smooth gradients do not produce them.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200) > 0
+    corners = find_singular_points(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), point_threshold)
+    corners &= cv2.dilate(np.uint8(edges), np.ones((5, 5), np.uint8)) > 0
+    return corners, edges
+
+
+def boxes_mask(boxes: List[Tuple[int, int, int, int]], size: Tuple[int, int]) -> np.ndarray:
+    """Returns bool mask of (x, y, width, height) boxes clipped to the (width, height) size"""
+    width, height = size
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in boxes:
+        x_min, y_min = max(0, int(round(x))), max(0, int(round(y)))
+        x_max, y_max = min(width, int(round(x + w))), min(height, int(round(y + h)))
+        if x_max > x_min and y_max > y_min:
+            mask[y_min:y_max, x_min:x_max] = True
+    return mask
+
+
+def quantize_colors(image: np.ndarray, bins: int = 16, max_pixels: int = 128 * 128) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns mean colors and pixel counts of the filled cells of the 3D color histogram.
+
+    The image is downsampled to max_pixels first, a bins x bins x bins histogram keeps
+    at most bins ** 3 colors of any image size.
+    """
+    pixels = image.reshape(-1, 3)
+    h, w = image.shape[:2]
+    if h * w > max_pixels:
+        scale = (max_pixels / (h * w)) ** 0.5
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        pixels = cv2.resize(image, size, interpolation=cv2.INTER_AREA).reshape(-1, 3)
+
+    cells = pixels.astype(np.int64) * bins // 256
+    cell_index = (cells[:, 0] * bins + cells[:, 1]) * bins + cells[:, 2]
+    counts = np.bincount(cell_index, minlength=bins ** 3)
+    filled = np.nonzero(counts)[0]
+    sums = np.stack(
+        [np.bincount(cell_index, weights=pixels[:, c], minlength=bins ** 3)[filled] for c in range(3)], axis=1
+    )
+    weights = counts[filled].astype(np.float64)
+    return sums / weights[:, None], weights
+
+
+def dominant_colors(
+    image: np.ndarray,
+    num_colors: int = 5,
+    bins: int = 16,
+    max_pixels: int = 128 * 128,
+    n_init: int = 3,
+    max_iterations: int = 20,
+    seed: int = 0,
+) -> List[Tuple[Tuple[int, int, int], float]]:
+    """Clusters colors of the image with weighted k-means on the color histogram
+
+    Args:
+        image (np.ndarray): image with 3 channels, colors are returned in its channels order
+        num_colors (int): number of clusters
+        bins (int): histogram bins per channel
+        max_pixels (int): the image is downsampled to this number of pixels
+        n_init (int): number of k-means runs, the run with the least inertia is used
+        max_iterations (int): k-means iterations limit of a run
+        seed (int): seed of the k-means++ initialization
+
+    Returns:
+        list: (color, share of pixels) of the clusters, the dominant color first
+    """
+    colors, weights = quantize_colors(image, bins, max_pixels)
+    num_colors = min(num_colors, len(colors))
+    rng = np.random.default_rng(seed)
+
+    best_centers, best_labels, best_inertia = None, None, None
+    for _ in range(n_init):
+        centers, labels, inertia = _weighted_kmeans(colors, weights, num_colors, max_iterations, rng)
+        if best_inertia is None or inertia < best_inertia:
+            best_centers, best_labels, best_inertia = centers, labels, inertia
+
+    cluster_weights = np.bincount(best_labels, weights=weights, minlength=len(best_centers))
+    order = np.argsort(-cluster_weights)
+    return [
+        (tuple(int(round(v)) for v in best_centers[i]), float(cluster_weights[i] / weights.sum()))
+        for i in order
+        if cluster_weights[i] > 0
+    ]
+
+
+def _weighted_kmeans(
+    points: np.ndarray, weights: np.ndarray, num_clusters: int, max_iterations: int, rng: np.random.Generator
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Lloyd iterations with weighted k-means++ initialization, returns centers, labels and inertia"""
+
+    def squared_distances(centers: np.ndarray) -> np.ndarray:
+        return ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+
+    centers = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    for _ in range(1, num_clusters):
+        probabilities = squared_distances(np.array(centers)).min(axis=1) * weights
+        if probabilities.sum() == 0:
+            break
+        centers.append(points[rng.choice(len(points), p=probabilities / probabilities.sum())])
+    centers = np.array(centers, dtype=np.float64)
+
+    for _ in range(max_iterations):
+        labels = squared_distances(centers).argmin(axis=1)
+        cluster_weights = np.bincount(labels, weights=weights, minlength=len(centers))
+        is_filled = cluster_weights > 0
+        new_centers = centers.copy()
+        for c in range(points.shape[1]):
+            sums = np.bincount(labels, weights=weights * points[:, c], minlength=len(centers))
+            new_centers[is_filled, c] = sums[is_filled] / cluster_weights[is_filled]
+        is_converged = np.allclose(new_centers, centers, atol=0.5)
+        centers = new_centers
+        if is_converged:
+            break
+
+    distances = squared_distances(centers)
+    labels = distances.argmin(axis=1)
+    inertia = float((distances[np.arange(len(points)), labels] * weights).sum())
+    return centers, labels, inertia
+
+
 def bbox_w_h_to_x_max_y_max(box: tuple):
     x_min = box[0]
     y_min = box[1]
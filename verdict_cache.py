@@ -0,0 +1,74 @@
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from disk_cache import DiskCache
+
+
+@dataclass
+class Verdict:
+    """Cached checker result, remarks are the InvalidOutput message of a rejected image"""
+
+    accepted: bool
+    remarks: Optional[str] = None
+    checker: Optional[str] = None
+    score: Optional[float] = None
+    created_at: float = 0.0
+
+
+class VerdictCache(DiskCache):
+    """Disk cache of checker verdicts.
+
+    The key is a hash of the image content and the checker fingerprint. Entries older
+    than ttl seconds are ignored and removed, entries are evicted in LRU order when
+    the cache size exceeds max_size bytes.
+    """
+
+    name = "Verdict cache"
+
+    def __init__(self, cache_dir: str, ttl: float | None = 7 * 24 * 3600, max_size: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        super().__init__(cache_dir, max_size, "json")
+
+    @staticmethod
+    def build_key(image: str | bytes, checker_name: str, fingerprint: str = "") -> str:
+        """Builds cache key of the verdict
+
+        Args:
+            image (str | bytes): image path or encoded image bytes
+            checker_name (str): checker type
+            fingerprint (str): checker prompt and settings
+
+        Returns:
+            str: hex digest
+        """
+        key_hash = hashlib.sha256()
+        if isinstance(image, bytes):
+            key_hash.update(image)
+        else:
+            with open(image, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    key_hash.update(chunk)
+        key_hash.update(checker_name.encode("utf-8"))
+        key_hash.update(fingerprint.encode("utf-8"))
+        return key_hash.hexdigest()
+
+    def get(self, key: str) -> Verdict | None:
+        """Returns not expired verdict or None"""
+        return super().get(key)
+
+    def put(self, key: str, verdict: Verdict):
+        """Saves the verdict and evicts least recently used entries"""
+        verdict.created_at = verdict.created_at or time.time()
+        super().put(key, json.dumps(verdict.__dict__).encode("utf-8"))
+
+    def decode(self, data: bytes) -> Verdict:
+        verdict = Verdict(**json.loads(data))
+        if self.is_expired(verdict.created_at):
+            raise ValueError("Verdict is expired")
+        return verdict
+
+    def is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl